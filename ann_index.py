@@ -0,0 +1,143 @@
+import logging
+import os
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+def _sq_distances(a, b, b_sq_norms=None):
+    """Squared euclidean distances between every row of a and every row of b."""
+    if b_sq_norms is None:
+        b_sq_norms = np.einsum("ij,ij->i", b, b)
+    a_sq_norms = np.einsum("ij,ij->i", a, a)
+    sq = a_sq_norms[:, None] - 2.0 * (a @ b.T) + b_sq_norms[None, :]
+    return np.maximum(sq, 0.0)
+
+
+def _assign(vectors, centroids, chunk=8192):
+    """Index of the nearest centroid for every vector, in chunks to bound memory."""
+    c_sq = np.einsum("ij,ij->i", centroids, centroids)
+    out = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        block = vectors[start:start + chunk]
+        out[start:start + chunk] = np.argmin(_sq_distances(block, centroids, c_sq), axis=1)
+    return out
+
+
+def kmeans(vectors, k, iterations=10, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        counts = np.bincount(labels, minlength=k)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty clusters from random points so every list stays usable
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), size=len(empty), replace=False)]
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index: k-means partitions the gallery into lists and a
+    query only scans the rows of the n_probe closest lists.
+
+    The index stores row numbers into FaceGallery.matrix, the gallery still
+    owns the embeddings and does the final exact distance check on the
+    candidates.
+    """
+
+    def __init__(self, n_lists=None, n_probe=8, train_iterations=10, seed=0):
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_iterations = train_iterations
+        self.seed = seed
+        self.centroids = None
+        self.lists = []
+        self.size = 0
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def build(self, matrix):
+        n = len(matrix)
+        if n == 0:
+            return self
+        k = self.n_lists or max(1, int(4 * np.sqrt(n)))
+        k = min(k, n)
+
+        # Train on a sample, big galleries don't need every row to place centroids
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(n, 64 * k)
+        sample = matrix if sample_size == n else matrix[rng.choice(n, size=sample_size, replace=False)]
+
+        self.centroids = kmeans(np.asarray(sample, dtype=np.float64), k, self.train_iterations, self.seed)
+        self._set_assignments(_assign(matrix, self.centroids))
+        return self
+
+    def _set_assignments(self, labels):
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+        self.size = len(labels)
+
+    def add(self, row, vector):
+        """Insert one new gallery row without retraining."""
+        if not self.is_trained:
+            return
+        label = int(_assign(np.asarray(vector, dtype=np.float64).reshape(1, -1), self.centroids)[0])
+        self.lists[label] = np.append(self.lists[label], row)
+        self.size += 1
+
+    def candidates(self, query):
+        """Gallery row numbers worth an exact distance check for this query."""
+        query = np.asarray(query, dtype=np.float64).reshape(1, -1)
+        dists = _sq_distances(query, self.centroids)[0]
+        n_probe = min(self.n_probe, len(self.centroids))
+        probe = np.argpartition(dists, n_probe - 1)[:n_probe]
+        return np.concatenate([self.lists[i] for i in probe])
+
+    # --------------------- PERSISTENCE ---------------------
+
+    def save(self, path, student_ids):
+        labels = np.empty(self.size, dtype=np.int64)
+        for i, rows in enumerate(self.lists):
+            labels[rows] = i
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                labels=labels,
+                student_ids=np.array(student_ids, dtype=str),
+                params=np.array([self.n_probe, self.train_iterations, self.seed]),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, student_ids):
+        """Load a saved index, or None if it is missing or was built for a different roster."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                saved_ids = data["student_ids"].tolist()
+                if saved_ids != list(student_ids):
+                    return None
+                n_probe, train_iterations, seed = (int(v) for v in data["params"])
+                index = cls(len(data["centroids"]), n_probe, train_iterations, seed)
+                index.centroids = data["centroids"]
+                index._set_assignments(data["labels"])
+                return index
+        except (OSError, KeyError, ValueError) as e:
+            log.warning("⚠️ Could not load ANN index %s: %s", path, e)
+            return None
+
+
+def index_path_for(db_path):
+    """ANN index file kept next to the SQLite DB, e.g. face_data.db -> face_data.ivf.npz."""
+    return os.path.splitext(db_path)[0] + ".ivf.npz"
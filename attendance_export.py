@@ -0,0 +1,182 @@
+import os
+import csv
+import json
+import itertools
+from db import get_db
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def _attendance_query(columns, start_date, end_date=None, unit=None, student_id=None, after_id=None):
+    # Dates are stored as YYYY-MM-DD text, so a range is a plain string range on idx_attendance_date
+    clauses = ["date >= ?", "date <= ?"]
+    params = [start_date, end_date or start_date]
+    if unit:
+        clauses.append("unit = ?")
+        params.append(unit)
+    if student_id:
+        clauses.append("student_id = ?")
+        params.append(student_id)
+    if after_id is not None:
+        clauses.append("id > ?")
+        params.append(after_id)
+    sql = f"SELECT {', '.join(columns)} FROM attendance WHERE {' AND '.join(clauses)}"
+    return sql, params
+
+
+def iter_attendance(columns, start_date, end_date=None, unit=None, student_id=None, order_by="date, time",
+                    batch_size=EXPORT_BATCH_SIZE, db_path="face_data.db"):
+    """Yield lists of up to batch_size rows, never holding the whole result in memory."""
+    sql, params = _attendance_query(columns, start_date, end_date, unit, student_id)
+    # A dedicated cursor on this thread's connection, read with fetchmany
+    cursor = get_db(db_path).connection().execute(f"{sql} ORDER BY {order_by}", params)
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def export_attendance_csv(file_path, start_date, end_date=None, unit=None, student_id=None,
+                          batch_size=EXPORT_BATCH_SIZE, db_path="face_data.db"):
+    """Stream attendance rows for a date range into a CSV; returns the number of rows written.
+
+    No file is created when nothing matches.
+    """
+    batches = iter_attendance(("student_id", "date", "time"), start_date, end_date, unit, student_id,
+                              batch_size=batch_size, db_path=db_path)
+    first = next(batches, None)
+    if first is None:
+        return 0
+
+    written = 0
+    with open(file_path, mode="w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Student ID", "Date", "Time"])
+        for batch in itertools.chain([first], batches):
+            writer.writerows(batch)
+            written += len(batch)
+    return written
+
+
+# --------------------- COLUMNAR EXPORT ---------------------
+
+# Columns in the files; the date is the partition directory
+COLUMNAR_COLUMNS = ("id", "student_id", "name", "time", "unit")
+EXPORT_STATE_FILE = "_export_state.json"
+
+
+def _load_pyarrow():
+    # Optional dependency, only needed for analytics exports
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.ipc
+    except ImportError as e:
+        raise RuntimeError("Columnar export needs pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+def _read_export_state(out_dir):
+    try:
+        with open(os.path.join(out_dir, EXPORT_STATE_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"last_id": 0}
+
+
+def _write_export_state(out_dir, state):
+    path = os.path.join(out_dir, EXPORT_STATE_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def export_attendance_columnar(out_dir="attendance_analytics", fmt="parquet", compression="zstd",
+                               batch_size=EXPORT_BATCH_SIZE * 10, db_path="face_data.db"):
+    """Append attendance rows added since the last run to a date-partitioned columnar dataset.
+
+    Layout: out_dir/date=YYYY-MM-DD/part-<first id>.parquet (or .arrow for Arrow IPC).
+    The date is only in the hive partition directory, not a column in the files,
+    so readers such as pyarrow.parquet.read_table(out_dir) get it back from the path.
+    The highest exported attendance.id is kept in out_dir/_export_state.json, so
+    each run only reads and writes new rows. Returns the number of rows exported.
+    """
+    if fmt not in ("parquet", "arrow"):
+        raise ValueError("fmt must be 'parquet' or 'arrow'")
+    pa = _load_pyarrow()
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("student_id", pa.string()),
+        ("name", pa.string()),
+        ("time", pa.string()),
+        ("unit", pa.string()),
+    ])
+
+    os.makedirs(out_dir, exist_ok=True)
+    state = _read_export_state(out_dir)
+    last_id = state.get("last_id", 0)
+
+    cursor = get_db(db_path).connection().execute(
+        f"SELECT {', '.join(COLUMNAR_COLUMNS)}, date FROM attendance WHERE id > ? ORDER BY id", (last_id,)
+    )
+
+    writers = {}
+    exported = 0
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+
+            by_date = {}
+            for row in rows:
+                by_date.setdefault(row[-1], []).append(row[:-1])
+
+            for date, date_rows in by_date.items():
+                writer = writers.get(date)
+                if writer is None:
+                    partition = os.path.join(out_dir, f"date={date}")
+                    os.makedirs(partition, exist_ok=True)
+                    path = os.path.join(partition, f"part-{date_rows[0][0]:012d}.{fmt}")
+                    if fmt == "parquet":
+                        writer = pa.parquet.ParquetWriter(path, schema, compression=compression)
+                    else:
+                        options = pa.ipc.IpcWriteOptions(compression=compression)
+                        writer = pa.ipc.new_file(path, schema, options=options)
+                    writers[date] = writer
+
+                columns = list(zip(*date_rows))
+                table = pa.Table.from_arrays([pa.array(col, type=field.type)
+                                              for col, field in zip(columns, schema)], schema=schema)
+                writer.write_table(table)
+
+            exported += len(rows)
+            last_id = rows[-1][0]
+    finally:
+        cursor.close()
+        for writer in writers.values():
+            writer.close()
+
+    # Only advance the watermark once every partition file is closed
+    if exported:
+        state["last_id"] = last_id
+        _write_export_state(out_dir, state)
+    return exported
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Incremental columnar export of the attendance table")
+    parser.add_argument("out_dir", nargs="?", default="attendance_analytics")
+    parser.add_argument("--format", choices=("parquet", "arrow"), default="parquet")
+    parser.add_argument("--db", default="face_data.db")
+    args = parser.parse_args()
+
+    count = export_attendance_columnar(args.out_dir, fmt=args.format, db_path=args.db)
+    print(f"📦 Exported {count} new attendance rows to {args.out_dir}")
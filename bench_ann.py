@@ -0,0 +1,65 @@
+"""Recall / latency benchmark of the IVF ANN index against exact gallery search.
+
+    python bench_ann.py --size 50000 --queries 500 --probes 1 4 8 16
+"""
+import argparse
+import time
+import numpy as np
+from face_gallery import FaceGallery, EMBEDDING_DIM
+
+
+def synthetic_gallery(size, n_clusters=None, seed=0):
+    """Clustered 128-d embeddings roughly shaped like dlib face encodings."""
+    rng = np.random.default_rng(seed)
+    n_clusters = n_clusters or max(1, size // 50)
+    centers = rng.normal(0.0, 0.12, size=(n_clusters, EMBEDDING_DIM))
+    labels = rng.integers(0, n_clusters, size=size)
+    embeddings = centers[labels] + rng.normal(0.0, 0.04, size=(size, EMBEDDING_DIM))
+    return [str(i) for i in range(size)], embeddings
+
+
+def noisy_queries(embeddings, count, noise=0.02, seed=1):
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(embeddings), size=count)
+    return embeddings[picks] + rng.normal(0.0, noise, size=(count, EMBEDDING_DIM))
+
+
+def time_matches(gallery, queries, exact):
+    results = []
+    start = time.perf_counter()
+    for q in queries:
+        results.append(gallery.match(q, exact=exact))
+    elapsed = time.perf_counter() - start
+    return results, elapsed / len(queries) * 1000
+
+
+def run(size, n_queries, probes, n_lists=None):
+    ids, embeddings = synthetic_gallery(size)
+    queries = noisy_queries(embeddings, n_queries)
+    gallery = FaceGallery(ids, embeddings)
+
+    exact, exact_ms = time_matches(gallery, queries, exact=True)
+    print(f"📊 Gallery {size} | exact: {exact_ms:.3f} ms/query")
+
+    start = time.perf_counter()
+    gallery.build_index(n_lists=n_lists)
+    print(f"🧭 Index built in {time.perf_counter() - start:.2f}s ({len(gallery.index.centroids)} lists)")
+
+    for n_probe in probes:
+        gallery.index.n_probe = n_probe
+        approx, approx_ms = time_matches(gallery, queries, exact=False)
+        hits = sum(1 for a, e in zip(approx, exact) if a == e)
+        print(f"   n_probe={n_probe:<3} recall@1={hits / len(exact):.3f} "
+              f"{approx_ms:.3f} ms/query ({exact_ms / approx_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--lists", type=int, default=None)
+    args = parser.parse_args()
+
+    for size in args.size:
+        run(size, args.queries, args.probes, args.lists)
@@ -0,0 +1,290 @@
+"""Reproducible benchmarks for the recognition and attendance hot paths.
+
+    python bench_suite.py                                   # galleries of 100..100k, DB writes, dashboard
+    python bench_suite.py --sizes 100 5000 --video lecture.mp4
+    python bench_suite.py --save-baseline                   # record bench_baseline.json on this machine
+    python bench_suite.py --tolerance 0.25                  # exit 1 if any p50 is >25% above the baseline
+
+Synthetic embeddings use fixed seeds, so a run on the same machine measures
+the same work every time. Baselines are machine specific: record them on
+the kiosk hardware and compare there.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import numpy as np
+from bench_ann import synthetic_gallery, noisy_queries
+from face_gallery import FaceGallery, ANN_MIN_GALLERY_SIZE
+from db import get_db, create_tables, record_attendance
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+BASELINE_PATH = "bench_baseline.json"
+
+
+# --------------------- MEASUREMENT ---------------------
+
+def measure(fn, repeat, ops_per_call=1, warmup=3):
+    """Call fn repeat times after a warmup; p50/p95 latency per call and ops/s."""
+    for _ in range(min(warmup, repeat)):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, ops_per_call)
+
+
+def summarize(samples, ops_per_call=1):
+    samples = np.asarray(samples)
+    return {
+        "p50_ms": float(np.percentile(samples, 50) * 1000),
+        "p95_ms": float(np.percentile(samples, 95) * 1000),
+        "ops_per_s": float(ops_per_call * len(samples) / samples.sum()) if samples.sum() else 0.0,
+        "n": len(samples),
+    }
+
+
+def report(results, name, result):
+    results[name] = result
+    print(f"   {name:<40} p50 {result['p50_ms']:9.3f} ms  p95 {result['p95_ms']:9.3f} ms  "
+          f"{result['ops_per_s']:10.1f} ops/s")
+
+
+# --------------------- RECOGNITION ---------------------
+
+def bench_gallery(results, size, n_queries, faces_per_frame):
+    """Gallery matching as in util.recognize (one face) and App.recognize_faces (every face in a frame)."""
+    print(f"📊 Gallery of {size}")
+    ids, embeddings = synthetic_gallery(size)
+    queries = noisy_queries(embeddings, n_queries)
+    gallery = FaceGallery(ids, embeddings)
+
+    it = iter(range(10 ** 9))
+    single = lambda: gallery.match(queries[next(it) % n_queries], exact=True)
+    report(results, f"gallery_{size}_match_exact", measure(single, n_queries))
+
+    frames = [queries[i:i + faces_per_frame] for i in range(0, n_queries, faces_per_frame)]
+    it_frames = iter(range(10 ** 9))
+    frame = lambda: gallery.match_many(frames[next(it_frames) % len(frames)])
+    report(results, f"gallery_{size}_match_many_{faces_per_frame}", measure(frame, len(frames), faces_per_frame))
+
+    if size >= ANN_MIN_GALLERY_SIZE:
+        start = time.perf_counter()
+        gallery.build_index()
+        report(results, f"gallery_{size}_index_build", summarize([time.perf_counter() - start]))
+
+        it_ann = iter(range(10 ** 9))
+        single_ann = lambda: gallery.match(queries[next(it_ann) % n_queries])
+        report(results, f"gallery_{size}_match_ann", measure(single_ann, n_queries))
+        report(results, f"gallery_{size}_match_many_{faces_per_frame}_ann",
+               measure(frame, len(frames), faces_per_frame))
+
+
+def bench_video(results, path, gallery_size, max_frames, detection_scale):
+    """Detection (the executor's _locate_faces), face_encodings and match_many on every frame of a video."""
+    import cv2
+    import recognition_executor
+
+    # Loads face_recognition and cv2 into the module the way a pool worker does
+    recognition_executor._init_worker()
+
+    print(f"🎞️ Video {path} against a gallery of {gallery_size}")
+    ids, embeddings = synthetic_gallery(gallery_size)
+    gallery = FaceGallery(ids, embeddings)
+    if gallery_size >= ANN_MIN_GALLERY_SIZE:
+        gallery.build_index()
+
+    cap = cv2.VideoCapture(path)
+    detect, encode, match, faces = [], [], [], 0
+    while len(detect) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        img_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+        start = time.perf_counter()
+        locations = recognition_executor._locate_faces(img_rgb, "hog", detection_scale, None)
+        detect.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        encodings = recognition_executor._face_recognition.face_encodings(img_rgb, locations)
+        encode.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        gallery.match_many(encodings)
+        match.append(time.perf_counter() - start)
+        faces += len(encodings)
+    cap.release()
+
+    if not detect:
+        print(f"⚠️ No frames read from {path}")
+        return
+    name = os.path.splitext(os.path.basename(path))[0]
+    report(results, f"video_{name}_detect", summarize(detect))
+    report(results, f"video_{name}_encode", summarize(encode))
+    report(results, f"video_{name}_match_{gallery_size}", summarize(match))
+    print(f"   {len(detect)} frames, {faces} faces")
+
+
+# --------------------- DATABASE ---------------------
+
+def populate(db, n_students, attendance_per_student, seed=0):
+    rng = random.Random(seed)
+
+    def fill(conn):
+        conn.executemany(
+            "INSERT INTO users (student_id, name, wallet, embedding) VALUES (?, ?, ?, ?)",
+            [(f"S{i:06d}", f"Student {i}", f"0x{i:040x}", None) for i in range(n_students)]
+        )
+        rows = []
+        for i in range(n_students):
+            for day in range(rng.randint(0, attendance_per_student * 2)):
+                rows.append((f"S{i:06d}", f"Student {i}", f"2025-{1 + day // 28:02d}-{1 + day % 28:02d}",
+                             "09:00:00", "UnitPlaceholder"))
+        conn.executemany("INSERT INTO attendance (student_id, name, date, time, unit) VALUES (?, ?, ?, ?, ?)",
+                         rows)
+
+    db.write(fill)
+
+
+def bench_db_writes(results, db, n_students, n_batches, batch_size):
+    """mark_attendance-style transactions: sequential (one kiosk) and many queued at once (group commit)."""
+    print(f"🗄️ Attendance writes ({n_students} students)")
+    rng = random.Random(1)
+    pick = lambda: [f"S{rng.randrange(n_students):06d}" for _ in range(batch_size)]
+
+    report(results, f"db_mark_attendance_{batch_size}",
+           measure(lambda: db.write(record_attendance, pick(), "2026-01-01", "09:00:00"), n_batches, batch_size))
+
+    def burst():
+        futures = [db.submit_write(record_attendance, pick(), "2026-01-01", "09:00:00") for _ in range(32)]
+        for future in futures:
+            future.result()
+    report(results, f"db_mark_attendance_{batch_size}_x32_concurrent",
+           measure(burst, max(1, n_batches // 32), 32 * batch_size))
+
+
+def bench_dashboard(results, db_path, n_students, repeat):
+    """Reward dashboard queries: row count, first page, a deep keyset page, one student's panel."""
+    from util import count_reward_rows, fetch_reward_page, fetch_reward_summary
+
+    print("📋 Dashboard queries")
+    report(results, "dashboard_count", measure(lambda: count_reward_rows(db_path=db_path), repeat))
+    report(results, "dashboard_first_page",
+           measure(lambda: fetch_reward_page(100, sort="attendance_days", descending=True, db_path=db_path), repeat))
+
+    deep = n_students // 2
+    report(results, "dashboard_deep_page_offset",
+           measure(lambda: fetch_reward_page(100, sort="student_id", offset=deep, db_path=db_path), repeat))
+    page = fetch_reward_page(100, sort="student_id", offset=deep - 100, db_path=db_path)
+    after = (page[-1][0], page[-1][0]) if page else None
+    report(results, "dashboard_deep_page_keyset",
+           measure(lambda: fetch_reward_page(100, sort="student_id", after=after, db_path=db_path), repeat))
+
+    sid = f"S{n_students // 2:06d}"
+    report(results, "dashboard_student_summary",
+           measure(lambda: fetch_reward_summary(sid, db_path=db_path), repeat))
+
+
+# --------------------- BASELINES ---------------------
+
+def compare(results, baseline, tolerance):
+    """Names whose p50 latency got more than tolerance (fraction) slower than the baseline."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base["p50_ms"]:
+            continue
+        ratio = result["p50_ms"] / base["p50_ms"]
+        if ratio > 1 + tolerance:
+            regressions.append((name, base["p50_ms"], result["p50_ms"], ratio))
+    return regressions
+
+
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__,
+            "machine": platform.machine(), "processor": platform.processor(), "cpus": os.cpu_count()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="gallery sizes")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--faces-per-frame", type=int, default=4)
+    parser.add_argument("--video", nargs="*", default=[], help="recorded videos to run detection + encoding on")
+    parser.add_argument("--video-frames", type=int, default=300)
+    parser.add_argument("--video-gallery", type=int, default=1000)
+    parser.add_argument("--detection-scale", type=float, default=0.5)
+    parser.add_argument("--students", type=int, default=5000, help="users in the benchmark DB")
+    parser.add_argument("--batches", type=int, default=200, help="attendance transactions to time")
+    parser.add_argument("--batch-size", type=int, default=5, help="students marked per transaction")
+    parser.add_argument("--skip", nargs="*", default=[], choices=["gallery", "video", "db", "dashboard"])
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--output", help="also write this run's results as JSON")
+    args = parser.parse_args()
+
+    np.random.seed(0)
+    results = {}
+
+    if "gallery" not in args.skip:
+        for size in args.sizes:
+            bench_gallery(results, size, args.queries, args.faces_per_frame)
+
+    if "video" not in args.skip:
+        for path in args.video:
+            bench_video(results, path, args.video_gallery, args.video_frames, args.detection_scale)
+
+    if not {"db", "dashboard"} <= set(args.skip):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "bench.db")
+            # util's dashboard queries look the path up through get_db() too
+            db = get_db(db_path)
+            db.write(create_tables)
+            db.migrate()
+            populate(db, args.students, attendance_per_student=20)
+            if "db" not in args.skip:
+                bench_db_writes(results, db, args.students, args.batches, args.batch_size)
+            if "dashboard" not in args.skip:
+                bench_dashboard(results, db_path, args.students, args.queries)
+            db.close()
+
+    run = {"environment": environment(), "created": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+        print(f"💾 Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"ℹ️ No baseline at {args.baseline}, run with --save-baseline to record one")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("environment") != run["environment"]:
+        print("⚠️ Baseline was recorded on a different environment, comparison may not be meaningful")
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name, before, after, ratio in regressions:
+        print(f"🚨 {name}: p50 {before:.3f} ms -> {after:.3f} ms ({ratio:.2f}x)")
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+        return 1
+    print(f"✅ No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,33 +1,191 @@
+import logging
 import os
 import json
+import threading
+import time
+from urllib.parse import urlsplit
 from web3 import Web3
+from web3.exceptions import ContractLogicError, TransactionNotFound
 from dotenv import load_dotenv
+from rpc_provider import FailoverProvider, DEFAULT_TIMEOUT, _retryable
+from metrics import metrics
+
+log = logging.getLogger(__name__)
 
 load_dotenv()
 
 # Load environment variables
 PRIVATE_KEY = os.getenv("PRIVATE_KEY")
 PUBLIC_KEY = os.getenv("PUBLIC_KEY")
+# Comma-separated for failover, primary first
 WEB3_PROVIDER = os.getenv("WEB3_PROVIDER")
-NFT_CONTRACT_ADDRESS = Web3.to_checksum_address(os.getenv("NFT_CONTRACT_ADDRESS"))
-TOKEN_CONTRACT_ADDRESS = Web3.to_checksum_address(os.getenv("TOKEN_CONTRACT_ADDRESS"))
+NFT_CONTRACT_ADDRESS = os.getenv("NFT_CONTRACT_ADDRESS")
+TOKEN_CONTRACT_ADDRESS = os.getenv("TOKEN_CONTRACT_ADDRESS")
+
+
+class ChainUnavailable(RuntimeError):
+    """The RPC endpoint can't be reached (or isn't configured) right now."""
+
+
+def is_transport_error(error):
+    """A connection error, timeout or 429/5xx left over after FailoverProvider's retries, not a node reply."""
+    return _retryable(error)
+
+
+# -----------------------------
+# Lazily connected client
+# -----------------------------
+class ChainClient:
+    """Web3 connection and contracts, created on first use instead of at import.
+
+    start() connects on a background thread, retrying with backoff, then
+    health-checks the endpoint every health_interval seconds and reconnects
+    when it stops answering. Nothing here blocks the GUI: callers that can
+    wait check is_ready() (the reward dispatcher keeps jobs queued until
+    then), the w3/contract properties try one connect and otherwise raise
+    ChainUnavailable.
+
+    provider is an already built web3 provider used instead of provider_url,
+    e.g. a FailoverProvider over an EthereumTesterProvider as a local stand-in node.
+    """
+
+    def __init__(self, provider_url=None, health_interval=15.0, max_retry_delay=60.0, timeout=DEFAULT_TIMEOUT,
+                 provider=None):
+        self.provider_url = provider_url or WEB3_PROVIDER
+        self.timeout = timeout
+        self.provider = provider
+        self._given_provider = provider
+        self.health_interval = health_interval
+        self.max_retry_delay = max_retry_delay
+        self.last_error = None
+        self._w3 = None
+        self._nft_contract = None
+        self._token_contract = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._check_now = threading.Event()
+        self._thread = None
+
+    # --------------------- CONNECTION ---------------------
+
+    def connect(self):
+        """One blocking connection attempt; returns True when the client is usable.
+
+        The network round trips happen outside _lock, so a slow or hung endpoint
+        never blocks other threads behind it; the lock only publishes the result.
+        Concurrent attempts may both connect, the first to finish is kept.
+        """
+        if self._ready.is_set():
+            return True
+        try:
+            endpoint = self._given_provider or self.provider_url
+            if not all([PRIVATE_KEY, PUBLIC_KEY, endpoint, NFT_CONTRACT_ADDRESS, TOKEN_CONTRACT_ADDRESS]):
+                raise ChainUnavailable("❌ Missing environment variables")
+
+            provider = self._given_provider
+            if provider is None:
+                urls = [url.strip() for url in self.provider_url.split(",") if url.strip()]
+                provider = FailoverProvider.from_urls(urls, timeout=self.timeout)
+            w3 = Web3(provider)
+            if not w3.is_connected():
+                raise ChainUnavailable("⚠️ Web3 provider connection failed")
+
+            with open("nft_abi.json") as f:
+                nft_abi = json.load(f)
+            with open("token_abi.json") as f:
+                token_abi = json.load(f)
+
+            nft_contract = w3.eth.contract(address=Web3.to_checksum_address(NFT_CONTRACT_ADDRESS), abi=nft_abi)
+            token_contract = w3.eth.contract(address=Web3.to_checksum_address(TOKEN_CONTRACT_ADDRESS),
+                                             abi=token_abi)
+        except Exception as e:
+            self.last_error = str(e)
+            return False
+
+        with self._lock:
+            if self._ready.is_set():
+                return True
+            self.provider = provider
+            self._nft_contract = nft_contract
+            self._token_contract = token_contract
+            self._w3 = w3
+            self.last_error = None
+            self._ready.set()
+        log.info("🔗 Connected to %s", self.provider_url if self._given_provider is None else self.provider)
+        return True
+
+    def start(self):
+        """Connect and health-check in the background; safe to call more than once."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._monitor, name="chain-monitor", daemon=True)
+            self._thread.start()
+        return self
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def rpc_stats(self):
+        """Request, retry and failover counters of the current provider."""
+        return self.provider.stats() if self.provider else {}
+
+    def report_failure(self):
+        """A request failed; re-check the endpoint now instead of at the next interval."""
+        self._check_now.set()
+
+    def _healthy(self):
+        try:
+            return self._w3.is_connected()
+        except Exception as e:
+            self.last_error = str(e)
+            return False
+
+    def _monitor(self):
+        delay = 1.0
+        while True:
+            if not self._ready.is_set():
+                if self.connect():
+                    delay = 1.0
+                else:
+                    log.warning("⚠️ Blockchain unreachable (%s), retrying in %.0fs", self.last_error, delay)
+                    self._check_now.wait(delay)
+                    self._check_now.clear()
+                    delay = min(delay * 2, self.max_retry_delay)
+                    continue
+
+            self._check_now.wait(self.health_interval)
+            self._check_now.clear()
+            if not self._healthy():
+                log.warning("⚠️ Lost connection to the blockchain, reconnecting")
+                self._ready.clear()
+
+    # --------------------- ACCESS ---------------------
 
-assert all([PRIVATE_KEY, PUBLIC_KEY, WEB3_PROVIDER, NFT_CONTRACT_ADDRESS, TOKEN_CONTRACT_ADDRESS]), "❌ Missing environment variables"
+    def _require(self):
+        if not self._ready.is_set() and not self.connect():
+            self.report_failure()
+            raise ChainUnavailable(self.last_error or "Blockchain not connected")
 
-# Connect to blockchain
-w3 = Web3(Web3.HTTPProvider(WEB3_PROVIDER))
-assert w3.is_connected(), "⚠️ Web3 provider connection failed"
+    @property
+    def w3(self):
+        self._require()
+        return self._w3
 
-# Load ABIs
-with open("nft_abi.json") as f:
-    nft_abi = json.load(f)
+    @property
+    def nft_contract(self):
+        self._require()
+        return self._nft_contract
 
-with open("token_abi.json") as f:
-    token_abi = json.load(f)
+    @property
+    def token_contract(self):
+        self._require()
+        return self._token_contract
+
+
+client = ChainClient()
 
-# Initialize contracts
-nft_contract = w3.eth.contract(address=NFT_CONTRACT_ADDRESS, abi=nft_abi)
-token_contract = w3.eth.contract(address=TOKEN_CONTRACT_ADDRESS, abi=token_abi)
 # NFT metadata already uploaded to IPFS — hardcoded token URI from CID
 token_uri = "ipfs://bafkreibghqpaxdqyzhjv6tpj7pm63dy6ykxlljfj2spf57zikkx4srv6xq"
 
@@ -38,22 +196,278 @@ try:
     token_uri = "ipfs://bafkreibghqpaxdqyzhjv6tpj7pm63dy6ykxlljfj2spf57zikkx4srv6xq"
 
 except Exception as e:
-    print(f"❌ Failed to load NFT metadata: {e}")
+    log.error("❌ Failed to load NFT metadata: %s", e)
     token_uri = None  # Safe fallback
     # You can optionally hardcode or fetch from IPFS here
 
+# -----------------------------
+# Nonce allocation
+# -----------------------------
+class NonceManager:
+    """Hands out nonces for PUBLIC_KEY locally so concurrent senders never reuse one.
+
+    Initialised from the chain's pending transaction count and re-synced after a
+    failed submission.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next = None
+
+    def allocate(self):
+        with self._lock:
+            if self._next is None:
+                self._next = client.w3.eth.get_transaction_count(PUBLIC_KEY, "pending")
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    def resync(self):
+        with self._lock:
+            self._next = None
+
+
+nonces = NonceManager()
+
+# -----------------------------
+# Cached chain reads
+# -----------------------------
+BALANCE_TTL = 30.0
+FEE_TTL = 12.0                  # about one block
+DEFAULT_PRIORITY_FEE_GWEI = 2
+
+
+class ChainCache:
+    """Cache for RPC reads so a reward doesn't pay for the same round trips every time.
+
+    immutable() values (chain id, token decimals and symbol) are fetched once;
+    expiring() values (sender balance, fee suggestion) are reused for their TTL.
+    calls counts the RPC requests actually made for cached reads, saved the ones avoided.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._immutable = {}
+        self._expiring = {}
+        self.calls = 0
+        self.saved = 0
+
+    def immutable(self, key, loader, cost=1):
+        with self._lock:
+            if key in self._immutable:
+                self.saved += cost
+                return self._immutable[key]
+        value = loader()
+        with self._lock:
+            self.calls += cost
+            self._immutable[key] = value
+        return value
+
+    def expiring(self, key, loader, ttl, cost=1):
+        with self._lock:
+            entry = self._expiring.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.saved += cost
+                return entry[0]
+        value = loader()
+        with self._lock:
+            self.calls += cost
+            self._expiring[key] = (value, time.monotonic() + ttl)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._expiring.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {"rpc_calls": self.calls, "rpc_calls_saved": self.saved,
+                    "immutable": sorted(self._immutable), "expiring": sorted(self._expiring)}
+
+
+cache = ChainCache()
+
+
+def _chain_gauges():
+    """Cache and RPC provider counters for /metrics."""
+    stats = cache.stats()
+    yield "chain_cache_rpc_calls", {}, stats["rpc_calls"]
+    yield "chain_cache_rpc_calls_saved", {}, stats["rpc_calls_saved"]
+    rpc = client.rpc_stats()
+    if not rpc:
+        return
+    yield "rpc_retries", {}, rpc["retries"]
+    yield "rpc_failovers", {}, rpc["failovers"]
+    for method, count in rpc["methods"].items():
+        yield "rpc_method_requests", {"method": method}, count
+    for name, endpoint in rpc["endpoints"].items():
+        # Host only: provider URLs often carry an API key in the path
+        name = urlsplit(name).netloc or name
+        yield "rpc_endpoint_requests", {"endpoint": name}, endpoint["requests"]
+        yield "rpc_endpoint_errors", {"endpoint": name}, endpoint["errors"]
+        yield "rpc_endpoint_avg_ms", {"endpoint": name}, endpoint["avg_ms"]
+        yield "rpc_endpoint_down", {"endpoint": name}, endpoint["down"]
+
+
+metrics.register_gauges(_chain_gauges)
+
+
+def chain_id():
+    return cache.immutable("chain_id", lambda: client.w3.eth.chain_id)
+
+
+def token_decimals():
+    return cache.immutable("token_decimals", lambda: client.token_contract.functions.decimals().call())
+
+
+def token_symbol():
+    return cache.immutable("token_symbol", lambda: client.token_contract.functions.symbol().call())
+
+
+def sender_balance():
+    return cache.expiring("balance", lambda: client.w3.eth.get_balance(PUBLIC_KEY), BALANCE_TTL)
+
+
+def _fetch_fees():
+    base_fee = client.w3.eth.get_block("latest").get("baseFeePerGas")
+    if base_fee is None:
+        # Pre-London chain, legacy pricing
+        return {"gasPrice": client.w3.eth.gas_price}
+    try:
+        priority_fee = client.w3.eth.max_priority_fee
+    except Exception:
+        priority_fee = client.w3.to_wei(DEFAULT_PRIORITY_FEE_GWEI, 'gwei')
+    # Stays valid through several consecutive full blocks (base fee rises at most 12.5% per block)
+    return {"maxFeePerGas": 2 * base_fee + priority_fee, "maxPriorityFeePerGas": priority_fee}
+
+
+def suggest_fees():
+    """EIP-1559 maxFeePerGas / maxPriorityFeePerGas (or gasPrice on legacy chains), cached for FEE_TTL."""
+    return dict(cache.expiring("fees", _fetch_fees, FEE_TTL, cost=2))
+
+
+def _tx_params(nonce, gas):
+    # chainId and fees supplied up front so build_transaction doesn't fetch them again
+    return {'from': PUBLIC_KEY, 'nonce': nonce, 'gas': gas, 'chainId': chain_id(), **suggest_fees()}
+
+# -----------------------------
+# Transaction builders
+# -----------------------------
+BATCH_BASE_GAS = 60000
+BATCH_GAS_PER_RECIPIENT = 40000
+
+
+def build_token_transfer(wallet, amount, nonce):
+    student_wallet = Web3.to_checksum_address(wallet)
+    amount_wei = int(amount * (10 ** token_decimals()))
+    log.info("🔁 Sending %s tokens (%d wei) to %s", amount, amount_wei, wallet)
+
+    return client.token_contract.functions.transfer(student_wallet, amount_wei).build_transaction(
+        _tx_params(nonce, 250000)
+    )
+
+
+class BatchRejected(RuntimeError):
+    """The token contract refused a batchReward dry run (not deployed with it, or it would revert)."""
+
+
+def build_token_batch_transfer(wallets, amounts, nonce):
+    """One RewardToken.batchReward call paying amounts[i] tokens to wallets[i].
+
+    Only the redeployed RewardToken (contracts/RewardToken.sol) has batchReward,
+    so the call is dry-run with estimate_gas first and BatchRejected raised
+    if it would revert, before anything is signed.
+    """
+    recipients = [Web3.to_checksum_address(w) for w in wallets]
+    decimals = token_decimals()
+    amounts_wei = [int(a * (10 ** decimals)) for a in amounts]
+    call = client.token_contract.functions.batchReward(recipients, amounts_wei)
+    try:
+        estimate = call.estimate_gas({"from": PUBLIC_KEY})
+    except ContractLogicError as e:
+        raise BatchRejected(str(e)) from e
+    except ValueError as e:
+        # Older nodes report reverts as plain JSON-RPC errors
+        if "revert" not in str(e).lower():
+            raise
+        raise BatchRejected(str(e)) from e
+    log.info("🔁 Sending %s tokens to %d wallets in one transaction", sum(amounts), len(recipients))
+
+    # Base cost plus one balance update per recipient, or the estimate with headroom if higher
+    gas = max(BATCH_BASE_GAS + BATCH_GAS_PER_RECIPIENT * len(recipients), int(estimate * 1.2))
+    return call.build_transaction(_tx_params(nonce, gas))
+
+
+def build_nft_mint(wallet, uri, nonce):
+    return client.nft_contract.functions.mintNFT(wallet, uri).build_transaction(_tx_params(nonce, 300000))
+
+# -----------------------------
+# Pipelined submission helpers (no waiting for receipts)
+# -----------------------------
+def _to_hex(data):
+    # HexBytes.hex() has dropped the 0x prefix in newer releases
+    return "0x" + bytes(data).hex()
+
+
+def sign_transaction(txn):
+    """Returns (raw transaction hex, tx hash hex) so the hash can be stored before broadcasting."""
+    signed_txn = client.w3.eth.account.sign_transaction(txn, private_key=PRIVATE_KEY)
+    return _to_hex(signed_txn.raw_transaction), _to_hex(signed_txn.hash)
+
+
+def broadcast_raw_transaction(raw_tx_hex):
+    tx_hash = _to_hex(client.w3.eth.send_raw_transaction(raw_tx_hex))
+    # Gas is now reserved from the sender's balance
+    cache.invalidate("balance")
+    return tx_hash
+
+
+def get_receipt(tx_hash):
+    """Receipt if the transaction is mined, otherwise None."""
+    try:
+        return client.w3.eth.get_transaction_receipt(tx_hash)
+    except TransactionNotFound:
+        return None
+
+
+def lookup_transaction(tx_hash):
+    """The transaction if the node knows it (pending or mined), otherwise None."""
+    try:
+        return client.w3.eth.get_transaction(tx_hash)
+    except TransactionNotFound:
+        return None
+
+
+def mined_nonce():
+    """Every nonce below this is used up by a mined transaction."""
+    return client.w3.eth.get_transaction_count(PUBLIC_KEY, "latest")
+
+
+# Nodes only accept a replacement for a pending transaction with >= 10% higher fees
+REPLACEMENT_FEE_BUMP = 1.125
+
+
+def bump_fees(txn, pending):
+    """Raise txn's fees so it can replace `pending` (same nonce) in the mempool."""
+    for field in ("maxFeePerGas", "maxPriorityFeePerGas", "gasPrice"):
+        if field in txn and pending.get(field):
+            txn[field] = max(txn[field], int(pending[field] * REPLACEMENT_FEE_BUMP) + 1)
+    return txn
+
 # -----------------------------
 # Helper: Send signed transaction
 # -----------------------------
 def send_transaction(txn):
     try:
-        signed_txn = w3.eth.account.sign_transaction(txn, private_key=PRIVATE_KEY)
-        tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-        print(f"✅ Tx successful: {receipt.transactionHash.hex()}")
+        signed_txn = client.w3.eth.account.sign_transaction(txn, private_key=PRIVATE_KEY)
+        tx_hash = client.w3.eth.send_raw_transaction(signed_txn.raw_transaction)
+        cache.invalidate("balance")
+        receipt = client.w3.eth.wait_for_transaction_receipt(tx_hash)
+        log.info("✅ Tx successful: %s", _to_hex(receipt.transactionHash))
         return receipt
     except Exception as e:
-        print(f"🚨 Transaction failed: {e}")
+        log.error("🚨 Transaction failed: %s", e)
+        nonces.resync()
         return None
 
 # -----------------------------
@@ -61,26 +475,14 @@ def send_transaction(txn):
 # -----------------------------
 def send_token_to_wallet(wallet, amount=1):
     try:
-        student_wallet = Web3.to_checksum_address(wallet)
-        decimals = token_contract.functions.decimals().call()
-        amount_wei = int(amount * (10 ** decimals))
-        nonce = w3.eth.get_transaction_count(PUBLIC_KEY)
-
-        balance = w3.eth.get_balance(PUBLIC_KEY)
-        print(f"💰 Sender ETH balance: {w3.from_wei(balance, 'ether')} ETH")
-
-        print(f"🔁 Sending {amount} tokens ({amount_wei} wei) to {wallet}")
-
-        txn = token_contract.functions.transfer(wallet, amount_wei).build_transaction({
-            'from': PUBLIC_KEY,
-            'nonce': nonce,
-            'gas': 250000,
-            'gasPrice': w3.to_wei('15', 'gwei')
-        })
+        balance = sender_balance()
+        log.info("💰 Sender ETH balance: %s ETH", client.w3.from_wei(balance, 'ether'))
 
+        txn = build_token_transfer(wallet, amount, nonces.allocate())
         return send_transaction(txn)
     except Exception as e:
-        print(f"❌ Token transfer failed: {e}")
+        log.error("❌ Token transfer failed: %s", e)
+        nonces.resync()
         return None
 
 
@@ -91,17 +493,12 @@ def mint_student_nft(wallet, uri_override=None):
     try:
         uri = uri_override if uri_override else token_uri
         if not uri:
-            print("⚠️ No token URI available to mint NFT.")
+            log.warning("⚠️ No token URI available to mint NFT.")
             return None
 
-        nonce = w3.eth.get_transaction_count(PUBLIC_KEY)
-        txn = nft_contract.functions.mintNFT(wallet, uri).build_transaction({
-            'from': PUBLIC_KEY,
-            'nonce': nonce,
-            'gas': 300000,
-            'gasPrice': w3.to_wei('10', 'gwei')
-        })
+        txn = build_nft_mint(wallet, uri, nonces.allocate())
         return send_transaction(txn)
     except Exception as e:
-        print(f"❌ NFT minting failed: {e}")
+        log.error("❌ NFT minting failed: %s", e)
+        nonces.resync()
         return None
@@ -0,0 +1,2 @@
+# Manual scripts that send real transactions with the .env wallet, not tests
+collect_ignore = ["test_nft_minting.py", "test_token_transfer.py"]
@@ -15,4 +15,13 @@ contract RewardToken is ERC20 {
         require(msg.sender == admin, "Only admin can reward");
         _transfer(admin, to, amount);
     }
+
+    // Settle many rewards (e.g. a whole lecture) in a single transaction
+    function batchReward(address[] calldata recipients, uint256[] calldata amounts) external {
+        require(msg.sender == admin, "Only admin can reward");
+        require(recipients.length == amounts.length, "Length mismatch");
+        for (uint i = 0; i < recipients.length; i++) {
+            _transfer(admin, recipients[i], amounts[i]);
+        }
+    }
 }
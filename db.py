@@ -0,0 +1,340 @@
+import logging
+import sqlite3
+import threading
+import queue
+from concurrent.futures import Future
+
+log = logging.getLogger(__name__)
+
+DB_PATH = "face_data.db"
+
+# Applied to every connection. WAL lets the webcam thread, reward threads and
+# the dashboards read while the single writer commits.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",    # durable at checkpoints, safe with WAL
+    "PRAGMA cache_size=-16000",     # ~16 MB page cache per connection
+    "PRAGMA mmap_size=268435456",   # 256 MB memory-mapped reads
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+STATEMENT_CACHE_SIZE = 256
+# Jobs committed together by the writer when several are queued at once
+MAX_WRITE_BATCH = 64
+
+
+def create_tables(conn):
+    # Create users table with name and wallet
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            student_id TEXT PRIMARY KEY,
+            name TEXT,
+            wallet TEXT,
+            embedding BLOB
+        )
+    ''')
+
+    # Create attendance table with more fields
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS attendance (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id TEXT,
+            name TEXT,
+            date TEXT,
+            time TEXT,
+            unit TEXT,
+            FOREIGN KEY(student_id) REFERENCES users(student_id)
+        )
+    ''')
+
+
+def record_attendance(conn, student_ids, date, time_str, unit="UnitPlaceholder"):
+    """Attendance rows for every known student in one write job.
+
+    Returns (users {sid: (name, wallet)}, found [sid], reward_state {sid: (attendance_days, nft_awarded)}).
+    """
+    placeholders = ",".join("?" * len(student_ids))
+    cursor = conn.execute(
+        f"SELECT student_id, name, wallet, attendance_days, nft_awarded FROM users "
+        f"WHERE student_id IN ({placeholders})",
+        student_ids
+    )
+    rows = cursor.fetchall()
+    users = {sid: (name, wallet) for sid, name, wallet, _, _ in rows}
+    found = [sid for sid in student_ids if sid in users]
+    if not found:
+        return users, found, {}
+
+    # Insert attendance
+    conn.executemany("""
+        INSERT INTO attendance (student_id, name, date, time, unit)
+        VALUES (?, ?, ?, ?, ?)
+    """, [(sid, users[sid][0], date, time_str, unit) for sid in found])
+
+    # attendance_days is trigger-maintained, so the new total is just the old value + 1
+    return users, found, {sid: ((days or 0) + 1, nft) for sid, _, _, days, nft in rows}
+
+
+def _add_column(conn, table, column, definition):
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def _migration_attendance_indexes(conn):
+    # Per-student lookups (eligibility, student panel) and date-range exports.
+    # The date index also carries time and student_id so exports never touch the table.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_student_date ON attendance(student_id, date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(date, time, student_id)")
+
+
+def _migration_attendance_counter(conn):
+    # users.attendance_days is kept equal to COUNT(*) of the student's attendance rows by triggers,
+    # so eligibility checks read one row instead of counting the table.
+    _add_column(conn, "users", "attendance_days", "INTEGER DEFAULT 0")
+    conn.execute('''
+        UPDATE users SET attendance_days = (
+            SELECT COUNT(*) FROM attendance WHERE attendance.student_id = users.student_id
+        )
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS attendance_count_insert AFTER INSERT ON attendance
+        BEGIN
+            UPDATE users SET attendance_days = attendance_days + 1 WHERE student_id = NEW.student_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS attendance_count_delete AFTER DELETE ON attendance
+        BEGIN
+            UPDATE users SET attendance_days = attendance_days - 1 WHERE student_id = OLD.student_id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS attendance_count_update AFTER UPDATE OF student_id ON attendance
+        BEGIN
+            UPDATE users SET attendance_days = attendance_days - 1 WHERE student_id = OLD.student_id;
+            UPDATE users SET attendance_days = attendance_days + 1 WHERE student_id = NEW.student_id;
+        END
+    ''')
+
+
+def _migration_reward_columns(conn):
+    # Used to be added lazily (PRAGMA table_info + ALTER) every time a dashboard opened
+    _add_column(conn, "users", "nft_awarded", "INTEGER DEFAULT 0")
+    _add_column(conn, "users", "wallet", "TEXT")
+
+
+def _migration_reward_sort_indexes(conn):
+    # Keyset pagination of the reward dashboard sorts by these with student_id as tie-breaker
+    conn.execute("UPDATE users SET attendance_days = 0 WHERE attendance_days IS NULL")
+    conn.execute("UPDATE users SET nft_awarded = 0 WHERE nft_awarded IS NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_attendance_days ON users(attendance_days, student_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_nft_awarded ON users(nft_awarded, student_id)")
+
+
+def _migration_reward_jobs(conn):
+    # Durable queue behind reward_dispatcher.RewardDispatcher.
+    # wallet is NULL for 'token_batch' jobs: their recipients are the member jobs pointing at them
+    # through batch_id. prior_tx_hashes lists earlier signed versions of a job (fee-bumped
+    # replacements), any of which may be the one mined.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reward_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            student_id TEXT,
+            wallet TEXT,
+            amount INTEGER DEFAULT 1,
+            token_uri TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            nonce INTEGER,
+            raw_tx TEXT,
+            tx_hash TEXT,
+            prior_tx_hashes TEXT,
+            batch_id INTEGER,
+            attempts INTEGER DEFAULT 0,
+            error TEXT,
+            created_at REAL,
+            updated_at REAL
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reward_jobs_status ON reward_jobs(status, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reward_jobs_batch ON reward_jobs(batch_id)")
+
+
+# Applied in order, PRAGMA user_version records how many have run. Only ever append.
+MIGRATIONS = [
+    _migration_attendance_indexes,
+    _migration_attendance_counter,
+    _migration_reward_columns,
+    _migration_reward_sort_indexes,
+    _migration_reward_jobs,
+]
+
+
+def _connect(path):
+    # Autocommit mode; transactions are opened explicitly by the writer
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class Database:
+    """Shared access to face_data.db.
+
+    Reads use one long-lived connection per thread (statements stay in that
+    connection's prepared-statement cache). All writes go through a single
+    writer thread and queue, so concurrent threads never fight over the
+    file lock.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._write_queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="db-writer", daemon=True)
+        self._writer.start()
+
+    def migrate(self):
+        """Bring the schema up to date; returns the number of migrations applied.
+
+        Each migration runs once, in its own BEGIN IMMEDIATE transaction together
+        with its PRAGMA user_version bump, on a dedicated connection rather than
+        in the writer's group commit: a failing migration rolls back alone and
+        leaves user_version at the last one that succeeded.
+        """
+        conn = _connect(self.path)
+        applied = 0
+        try:
+            while True:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    # Read under the write lock, another process may have migrated in the meantime
+                    version = conn.execute("PRAGMA user_version").fetchone()[0]
+                    if version >= len(MIGRATIONS):
+                        conn.execute("COMMIT")
+                        return applied
+                    migration = MIGRATIONS[version]
+                    log.info("🛠️ Applying DB migration %d: %s", version + 1, migration.__name__)
+                    migration(conn)
+                    conn.execute(f"PRAGMA user_version={version + 1}")
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                applied += 1
+        finally:
+            conn.close()
+
+    # --------------------- READS ---------------------
+
+    def connection(self):
+        """This thread's connection (created on first use)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = _connect(self.path)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def query(self, sql, params=()):
+        return self.connection().execute(sql, params).fetchall()
+
+    def query_one(self, sql, params=()):
+        return self.connection().execute(sql, params).fetchone()
+
+    # --------------------- WRITES ---------------------
+
+    def submit_write(self, fn, *args):
+        """Run fn(conn, *args) in a transaction on the writer thread; returns a Future with its result."""
+        future = Future()
+        if threading.current_thread() is self._writer:
+            # Called from inside another write job, just run it in that transaction
+            future.set_result(fn(self._writer_conn, *args))
+            return future
+        self._write_queue.put((fn, args, future))
+        return future
+
+    def write(self, fn, *args):
+        """Blocking submit_write()."""
+        return self.submit_write(fn, *args).result()
+
+    def execute(self, sql, params=()):
+        """Single write statement; returns lastrowid."""
+        return self.write(lambda conn: conn.execute(sql, params).lastrowid)
+
+    def executemany(self, sql, seq_of_params):
+        return self.write(lambda conn: conn.executemany(sql, seq_of_params).rowcount)
+
+    def _write_loop(self):
+        self._writer_conn = _connect(self.path)
+        while True:
+            jobs = [self._write_queue.get()]
+            if jobs[0] is None:
+                break
+            # Group commit: drain whatever else is waiting into the same transaction
+            while len(jobs) < MAX_WRITE_BATCH:
+                try:
+                    job = self._write_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    self._write_queue.put(None)
+                    break
+                jobs.append(job)
+            self._run_batch(jobs)
+        self._writer_conn.close()
+
+    def _run_batch(self, jobs):
+        conn = self._writer_conn
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args, future in jobs:
+                # A savepoint per job so one failing job doesn't roll back the others
+                conn.execute("SAVEPOINT job")
+                try:
+                    results.append((future, fn(conn, *args), None))
+                    conn.execute("RELEASE job")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, _, future in jobs:
+                future.set_exception(e)
+            return
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def close(self):
+        self._write_queue.put(None)
+        self._writer.join(timeout=2)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_db(path=DB_PATH):
+    """Process-wide Database per file."""
+    with _databases_lock:
+        db = _databases.get(path)
+        if db is None:
+            db = _databases[path] = Database(path)
+        return db
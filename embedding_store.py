@@ -0,0 +1,205 @@
+import logging
+import os
+import glob
+import json
+import shutil
+import threading
+import numpy as np
+from face_gallery import FaceGallery, EMBEDDING_DIM
+from db import get_db
+
+log = logging.getLogger(__name__)
+
+EMBEDDING_DTYPE = np.float64
+
+
+def _ensure_version_tracking(conn):
+    """Version counter bumped by triggers whenever users.embedding changes."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS embedding_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO embedding_version (id, version) VALUES (1, 0)")
+    for event in ("INSERT", "UPDATE OF student_id, embedding", "DELETE"):
+        name = "users_embedding_" + event.split()[0].lower()
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON users
+            BEGIN
+                UPDATE embedding_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+
+
+class EmbeddingStore:
+    """Packed on-disk copy of users.embedding that is memory-mapped at startup.
+
+    face_data.db is mirrored into files next to it:
+      face_data.embeddings.<version>.f64   raw (N, 128) float64 rows
+      face_data.embeddings.json            {"version": ..., "matrix": ..., "student_ids": [...]}
+
+    The store is valid while its version equals embedding_version.version in
+    the DB; otherwise it is rebuilt from the users table once. Every version
+    is written to a new file (never over one that may be mapped: Windows
+    refuses to replace a mapped file) and the index is pointed at it. Older
+    versions are deleted once nothing maps them any more.
+    """
+
+    def __init__(self, db_path="face_data.db"):
+        self.db_path = db_path
+        self.base = os.path.splitext(db_path)[0]
+        self.index_path = self.base + ".embeddings.json"
+        self.matrix_path = None
+        self.version = -1
+        self.student_ids = []
+        self.matrix = np.empty((0, EMBEDDING_DIM), dtype=EMBEDDING_DTYPE)
+        self._lock = threading.Lock()
+
+        self.db = get_db(db_path)
+        self.db.write(_ensure_version_tracking)
+        self.open()
+
+    def db_version(self):
+        row = self.db.query_one("SELECT version FROM embedding_version WHERE id = 1")
+        return row[0] if row else 0
+
+    def open(self):
+        """Memory-map the packed matrix, rebuilding it first if it is out of date."""
+        with self._lock:
+            current = self.db_version()
+            if not self._load_files(current):
+                self._rebuild()
+        return self
+
+    def is_stale(self):
+        return self.db_version() != self.version
+
+    def refresh_if_stale(self):
+        """Cheap single-row version check; returns True if the store was reloaded."""
+        if not self.is_stale():
+            return False
+        self.open()
+        return True
+
+    def _versioned_path(self, version):
+        return f"{self.base}.embeddings.{version}.f64"
+
+    def _tmp_path(self, path):
+        # Unique per process and thread: the register script and the kiosk may write at the same time
+        return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    def _load_files(self, expected_version):
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if meta.get("version") != expected_version or not meta.get("matrix"):
+            return False
+
+        matrix_path = os.path.join(os.path.dirname(self.index_path), meta["matrix"])
+        student_ids = meta.get("student_ids", [])
+        row_bytes = EMBEDDING_DIM * np.dtype(EMBEDDING_DTYPE).itemsize
+        try:
+            size = os.path.getsize(matrix_path)
+        except OSError:
+            return False
+        if size != len(student_ids) * row_bytes:
+            return False
+
+        if student_ids:
+            self.matrix = np.memmap(matrix_path, dtype=EMBEDDING_DTYPE, mode="r",
+                                    shape=(len(student_ids), EMBEDDING_DIM))
+        else:
+            self.matrix = np.empty((0, EMBEDDING_DIM), dtype=EMBEDDING_DTYPE)
+        self.matrix_path = matrix_path
+        self.student_ids = student_ids
+        self.version = expected_version
+        self._remove_old_versions()
+        return True
+
+    def _publish(self, tmp_path, version, student_ids):
+        """Move a finished matrix file into place as `version` and point the index at it."""
+        path = self._versioned_path(version)
+        try:
+            os.replace(tmp_path, path)
+        except PermissionError:
+            # Another process published this version first and has it mapped (Windows);
+            # same version, same rows, so use theirs
+            os.remove(tmp_path)
+        self._write_index(version, os.path.basename(path), student_ids)
+        self._load_files(version)
+
+    def _remove_old_versions(self):
+        """Delete superseded matrix files; ones still mapped somewhere are retried on the next load."""
+        for path in glob.glob(glob.escape(self.base) + ".embeddings.*.f64"):
+            version = path[len(self.base) + len(".embeddings."):-len(".f64")]
+            # Newer ones may have just been published by another process
+            if not version.isdigit() or int(version) >= self.version:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                # Windows: an old gallery in this or another process still maps it
+                pass
+
+    def _rebuild(self):
+        conn = self.db.connection()
+        # Read the version in the same (snapshot) transaction as the rows so they agree
+        conn.execute("BEGIN")
+        try:
+            version = conn.execute("SELECT version FROM embedding_version WHERE id = 1").fetchone()[0]
+            rows = conn.execute(
+                "SELECT student_id, embedding FROM users WHERE embedding IS NOT NULL ORDER BY rowid"
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+
+        log.info("📦 Rebuilding embedding store from %d users", len(rows))
+        tmp_path = self._tmp_path(self._versioned_path(version))
+        with open(tmp_path, "wb") as f:
+            for _, blob in rows:
+                f.write(blob)
+        self._publish(tmp_path, version, [sid for sid, _ in rows])
+
+    def _write_index(self, version, matrix_name, student_ids):
+        tmp_path = self._tmp_path(self.index_path)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": version, "matrix": matrix_name, "student_ids": student_ids}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def append(self, student_id, embedding):
+        """Mirror a single new enrolment: a file copy plus one row, without reading the users table."""
+        with self._lock:
+            current = self.db_version()
+            if current != self.version + 1:
+                # Someone else changed users as well, resync from the table
+                if not self._load_files(current):
+                    self._rebuild()
+                return
+
+            tmp_path = self._tmp_path(self._versioned_path(current))
+            if self.student_ids:
+                shutil.copyfile(self.matrix_path, tmp_path)
+            with open(tmp_path, "ab") as f:
+                f.write(np.asarray(embedding, dtype=EMBEDDING_DTYPE).tobytes())
+            self._publish(tmp_path, current, self.student_ids + [student_id])
+
+    def gallery(self, **kwargs):
+        """FaceGallery over the memory-mapped matrix (no copy while it is not modified)."""
+        return FaceGallery(self.student_ids, self.matrix, **kwargs)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(db_path="face_data.db"):
+    """Process-wide store per DB file, shared by the GUI, util.recognize and batch tools."""
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = _stores[db_path] = EmbeddingStore(db_path)
+        return store
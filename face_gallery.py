@@ -0,0 +1,133 @@
+import logging
+import numpy as np
+from ann_index import IVFIndex, index_path_for
+
+log = logging.getLogger(__name__)
+
+
+# Same default as face_recognition.compare_faces
+DEFAULT_TOLERANCE = 0.6
+EMBEDDING_DIM = 128
+# Below this many students exact search is already fast enough
+ANN_MIN_GALLERY_SIZE = 2000
+
+
+class FaceGallery:
+    """All enrolled face embeddings packed into one (N, 128) matrix.
+
+    Matching is a single batched distance computation against the whole
+    matrix and returns the *closest* student under the tolerance, instead of
+    the first one that happens to pass compare_faces. An optional ANN index
+    (see ann_index.IVFIndex) narrows the rows that get scanned.
+    """
+
+    def __init__(self, student_ids=None, embeddings=None, tolerance=DEFAULT_TOLERANCE, dtype=np.float64,
+                 index=None):
+        self.tolerance = tolerance
+        self.dtype = dtype
+        self.index = index
+        self.student_ids = list(student_ids or [])
+
+        if embeddings is None or len(self.student_ids) == 0:
+            self.matrix = np.empty((0, EMBEDDING_DIM), dtype=dtype)
+        else:
+            self.matrix = np.ascontiguousarray(np.asarray(embeddings, dtype=dtype).reshape(-1, EMBEDDING_DIM))
+
+        if self.matrix.shape[0] != len(self.student_ids):
+            raise ValueError("student_ids and embeddings must have the same length")
+
+        self._sq_norms = np.einsum("ij,ij->i", self.matrix, self.matrix)
+
+    @classmethod
+    def from_pairs(cls, pairs, **kwargs):
+        """Build a gallery from [(student_id, embedding), ...] as stored in the users table."""
+        pairs = list(pairs)
+        ids = [sid for sid, _ in pairs]
+        embeddings = [emb for _, emb in pairs]
+        return cls(ids, embeddings, **kwargs)
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def add(self, student_id, embedding):
+        row = np.asarray(embedding, dtype=self.dtype).reshape(1, EMBEDDING_DIM)
+        self.matrix = np.ascontiguousarray(np.vstack([self.matrix, row]))
+        self._sq_norms = np.append(self._sq_norms, np.einsum("ij,ij->i", row, row))
+        self.student_ids.append(student_id)
+
+        if self.index is not None:
+            self.index.add(len(self.student_ids) - 1, row[0])
+
+    def distances(self, encoding, rows=None):
+        """Euclidean distance from one encoding to every enrolled embedding (or only the given rows)."""
+        query = np.asarray(encoding, dtype=self.dtype)
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        sq_norms = self._sq_norms if rows is None else self._sq_norms[rows]
+        # ||a - b||^2 = ||a||^2 - 2ab + ||b||^2, one matrix-vector product for the whole gallery
+        sq = sq_norms - 2.0 * (matrix @ query) + query @ query
+        return np.sqrt(np.maximum(sq, 0.0))
+
+    def match(self, encoding, tolerance=None, exact=False):
+        """Return (student_id, distance) of the nearest neighbour, or None if nobody is within tolerance."""
+        if len(self) == 0:
+            return None
+
+        tolerance = self.tolerance if tolerance is None else tolerance
+
+        rows = None
+        if self.index is not None and not exact:
+            rows = self.index.candidates(encoding)
+            if len(rows) == 0:
+                return None
+
+        dists = self.distances(encoding, rows)
+        best = int(np.argmin(dists))
+        if dists[best] <= tolerance:
+            row = best if rows is None else int(rows[best])
+            return self.student_ids[row], float(dists[best])
+        return None
+
+    def match_many(self, encodings, tolerance=None):
+        """match() for every face in a frame at once; exact search is one (N, 128) x (128, k) product."""
+        encodings = np.asarray(encodings, dtype=self.dtype).reshape(-1, EMBEDDING_DIM)
+        if len(self) == 0 or len(encodings) == 0:
+            return [None] * len(encodings)
+
+        if self.index is not None:
+            return [self.match(encoding, tolerance) for encoding in encodings]
+
+        tolerance = self.tolerance if tolerance is None else tolerance
+        q_sq = np.einsum("ij,ij->i", encodings, encodings)
+        sq = self._sq_norms[:, None] - 2.0 * (self.matrix @ encodings.T) + q_sq[None, :]
+        dists = np.sqrt(np.maximum(sq, 0.0))
+        best = np.argmin(dists, axis=0)
+        best_dists = dists[best, np.arange(len(encodings))]
+
+        return [
+            (self.student_ids[row], float(dist)) if dist <= tolerance else None
+            for row, dist in zip(best, best_dists)
+        ]
+
+    # --------------------- ANN INDEX ---------------------
+
+    def build_index(self, **index_kwargs):
+        self.index = IVFIndex(**index_kwargs).build(self.matrix)
+        return self.index
+
+    def load_or_build_index(self, db_path, min_size=ANN_MIN_GALLERY_SIZE, **index_kwargs):
+        """Attach the ANN index persisted next to db_path, rebuilding it if the roster changed."""
+        if len(self) < min_size:
+            self.index = None
+            return None
+
+        path = index_path_for(db_path)
+        self.index = IVFIndex.load(path, self.student_ids)
+        if self.index is None:
+            log.info("🧭 Building ANN index for %d embeddings", len(self))
+            self.build_index(**index_kwargs)
+            self.save_index(db_path)
+        return self.index
+
+    def save_index(self, db_path):
+        if self.index is not None and self.index.is_trained:
+            self.index.save(index_path_for(db_path), self.student_ids)
@@ -0,0 +1,105 @@
+import itertools
+import time
+
+
+def iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes."""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    inter = max(0, bottom - top) * max(0, right - left)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return inter / float(area_a + area_b - inter)
+
+
+class Track:
+    def __init__(self, track_id, box, now):
+        self.track_id = track_id
+        self.box = box
+        self.student_id = None
+        self.first_seen = now
+        self.last_seen = now
+        self.last_encoded = None
+        # Missed by the last detection pass
+        self.missed = False
+        # The face in the box may no longer be the one that was identified
+        self.suspect = False
+
+
+class FaceTracker:
+    """Greedy IoU tracker that remembers who each face track was matched to.
+
+    Faces only need encoding when a new track appears, while an unknown
+    track is retried, or when a known track is due for re-verification.
+    A known track is also re-verified straight away when it comes back after
+    a detection pass that missed it, or when its box jumps (overlaps its
+    previous box by less than stable_iou): that is how the next student
+    stepping into the same spot looks, and IoU alone would hand them the
+    previous student's identity.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_age=1.5, reverify_interval=10.0, unknown_retry_interval=1.0,
+                 stable_iou=0.6):
+        self.iou_threshold = iou_threshold
+        self.stable_iou = stable_iou
+        self.max_age = max_age
+        self.reverify_interval = reverify_interval
+        self.unknown_retry_interval = unknown_retry_interval
+        self.tracks = {}
+        self._ids = itertools.count(1)
+
+    def update(self, boxes, now=None):
+        """Associate this frame's face boxes with tracks; returns the tracks in box order."""
+        now = time.time() if now is None else now
+
+        # Forget tracks that left the frame
+        for track_id in [tid for tid, t in self.tracks.items() if now - t.last_seen > self.max_age]:
+            del self.tracks[track_id]
+
+        pairs = sorted(
+            ((iou(box, track.box), i, track.track_id)
+             for i, box in enumerate(boxes) for track in self.tracks.values()),
+            reverse=True
+        )
+
+        assigned = {}
+        used_tracks = set()
+        for overlap, i, track_id in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if i in assigned or track_id in used_tracks:
+                continue
+            assigned[i] = self.tracks[track_id]
+            used_tracks.add(track_id)
+
+        for track_id, track in self.tracks.items():
+            if track_id not in used_tracks:
+                track.missed = True
+
+        result = []
+        for i, box in enumerate(boxes):
+            track = assigned.get(i)
+            if track is None:
+                track = Track(next(self._ids), box, now)
+                self.tracks[track.track_id] = track
+            elif track.missed or iou(box, track.box) < self.stable_iou:
+                track.suspect = True
+            track.missed = False
+            track.box = box
+            track.last_seen = now
+            result.append(track)
+        return result
+
+    def needs_encoding(self, track, now=None):
+        now = time.time() if now is None else now
+        if track.last_encoded is None or track.suspect:
+            return True
+        interval = self.reverify_interval if track.student_id else self.unknown_retry_interval
+        return now - track.last_encoded >= interval
+
+    def set_identity(self, track, student_id, now=None):
+        track.student_id = student_id
+        track.suspect = False
+        track.last_encoded = time.time() if now is None else now
@@ -0,0 +1,94 @@
+import logging
+import threading
+import time
+import cv2
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+IDLE = "idle"
+ACTIVE = "active"
+
+
+class FrameGovernor:
+    """Picks the kiosk's capture rate and whether a frame gets full hand + face analysis.
+
+    Every captured frame is shrunk to a tiny grayscale probe and compared with
+    the previous one (frame differencing). While the scene is static the
+    governor stays IDLE: idle_fps, preview only, no MediaPipe or face
+    recognition. Motion switches it to ACTIVE at active_fps; it falls back to
+    IDLE after idle_after seconds without motion or keep_active() calls.
+
+    A probe pixel counts as changed when it differs by more than
+    pixel_threshold (0-255); motion is more than motion_fraction of pixels changed.
+    """
+
+    def __init__(self, idle_fps=4.0, active_fps=20.0, pixel_threshold=25, motion_fraction=0.01,
+                 idle_after=5.0, probe_size=(64, 48)):
+        self.idle_fps = idle_fps
+        self.active_fps = active_fps
+        self.pixel_threshold = pixel_threshold
+        self.motion_fraction = motion_fraction
+        self.idle_after = idle_after
+        self.probe_size = probe_size
+
+        self.state = IDLE
+        self.motion_score = 0.0
+        self.transitions = 0
+        self.last_activity = 0.0
+        self._previous = None
+        self._lock = threading.Lock()
+
+    def _probe(self, frame):
+        small = cv2.resize(frame, self.probe_size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        # Smooths sensor noise so it isn't mistaken for motion
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def observe(self, frame, now=None):
+        """Feed a captured BGR frame; returns True if it should get full analysis."""
+        now = time.monotonic() if now is None else now
+        probe = self._probe(frame)
+
+        with self._lock:
+            if self._previous is not None:
+                changed = np.count_nonzero(cv2.absdiff(probe, self._previous) > self.pixel_threshold)
+                self.motion_score = float(changed) / probe.size
+                if self.motion_score > self.motion_fraction:
+                    self.last_activity = now
+            self._previous = probe
+
+            self._set_state(ACTIVE if now - self.last_activity < self.idle_after else IDLE)
+            return self.state == ACTIVE
+
+    def keep_active(self, now=None):
+        """Someone is being analysed (e.g. a hand is up); don't go idle even if they hold still."""
+        with self._lock:
+            self.last_activity = time.monotonic() if now is None else now
+            self._set_state(ACTIVE)
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            self.transitions += 1
+            log.info("🎚️ Frame governor: %s (%.0f FPS)", state, self.fps())
+
+    def fps(self):
+        return self.active_fps if self.state == ACTIVE else self.idle_fps
+
+    def frame_interval(self):
+        return 1.0 / self.fps()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "fps": self.fps(),
+                "motion_score": round(self.motion_score, 4),
+                "transitions": self.transitions,
+                "idle_fps": self.idle_fps,
+                "active_fps": self.active_fps,
+                "pixel_threshold": self.pixel_threshold,
+                "motion_fraction": self.motion_fraction,
+                "idle_after": self.idle_after,
+            }
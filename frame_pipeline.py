@@ -0,0 +1,159 @@
+import logging
+import threading
+import time
+from collections import deque
+from queue import Empty
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class DropOldestQueue:
+    """Bounded queue that never blocks the producer: when full, the oldest item is dropped.
+
+    Used between pipeline stages so a slow consumer only ever sees the most
+    recent frames instead of building up latency.
+    """
+
+    def __init__(self, maxsize=2):
+        self.maxsize = maxsize
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                raise Empty
+            if not self._items:
+                raise Empty
+            return self._items.popleft()
+
+    def get_latest_nowait(self):
+        """Newest item (discarding anything older), or None if the queue is empty."""
+        with self._cond:
+            if not self._items:
+                return None
+            item = self._items.pop()
+            self.dropped += len(self._items)
+            self._items.clear()
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class BufferRing:
+    """Preallocated arrays handed out round-robin, so per-frame outputs don't allocate.
+
+    count must exceed the number of buffers that can be in flight at once
+    (queued, being processed and being displayed) or a buffer gets reused
+    while it is still being read.
+    """
+
+    def __init__(self, shape, dtype=np.uint8, count=8):
+        self._buffers = [np.empty(shape, dtype=dtype) for _ in range(count)]
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            buffer = self._buffers[self._next]
+            self._next = (self._next + 1) % len(self._buffers)
+            return buffer
+
+
+class PipelineStage:
+    """One or more daemon threads pulling items from input_queue and calling func(item)."""
+
+    def __init__(self, name, func, input_queue=None, workers=1):
+        self.name = name
+        self.func = func
+        self.input_queue = input_queue
+        self.workers = workers
+        self.processed = 0
+        self.errors = 0
+        self._threads = []
+        self._running = False
+
+    def start(self):
+        self._running = True
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        self._running = False
+        if self.input_queue is not None:
+            self.input_queue.close()
+
+    def join(self, timeout=None):
+        for t in self._threads:
+            t.join(timeout)
+
+    def _run(self):
+        while self._running:
+            if self.input_queue is None:
+                # Source stage, func produces items on its own (e.g. camera capture)
+                item = None
+            else:
+                try:
+                    item = self.input_queue.get(timeout=0.1)
+                except Empty:
+                    continue
+
+            try:
+                self.func(item)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                log.exception("🚨 %s stage error: %s", self.name, e)
+                time.sleep(0.01)
+
+
+class FramePipeline:
+    """Ordered set of stages started and stopped together."""
+
+    def __init__(self):
+        self.stages = []
+
+    def add_stage(self, name, func, input_queue=None, workers=1):
+        stage = PipelineStage(name, func, input_queue, workers)
+        self.stages.append(stage)
+        return stage
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self, timeout=1.0):
+        for stage in self.stages:
+            stage.stop()
+        for stage in self.stages:
+            stage.join(timeout)
+
+    def stats(self):
+        return {
+            stage.name: {
+                "processed": stage.processed,
+                "errors": stage.errors,
+                "queued": len(stage.input_queue) if stage.input_queue is not None else 0,
+                "dropped": stage.input_queue.dropped if stage.input_queue is not None else 0,
+            }
+            for stage in self.stages
+        }
@@ -0,0 +1,56 @@
+import time
+from dataclasses import dataclass, field
+
+# MediaPipe Hands landmark indices
+WRIST = 0
+MIDDLE_FINGER_TIP = 12
+
+
+@dataclass
+class HandAnalysis:
+    """Result of one MediaPipe Hands pass over a frame, shared by drawing and the gesture gate."""
+    landmarks: list = field(default_factory=list)
+    raised: bool = False
+    timestamp: float = 0.0
+
+    @property
+    def hand_detected(self):
+        return bool(self.landmarks)
+
+    def region(self, frame_shape, margin=2.0):
+        """Pixel box (top, right, bottom, left) around the hands, grown by margin x hand size on each side.
+
+        A raised hand sits next to the head, so this is where the face detector should look.
+        """
+        if not self.landmarks:
+            return None
+        height, width = frame_shape[:2]
+        xs = [lm.x for hand in self.landmarks for lm in hand.landmark]
+        ys = [lm.y for hand in self.landmarks for lm in hand.landmark]
+        hand_w = (max(xs) - min(xs)) * width
+        hand_h = (max(ys) - min(ys)) * height
+        grow = margin * max(hand_w, hand_h)
+
+        top = max(0, int(min(ys) * height - grow))
+        bottom = min(height, int(max(ys) * height + grow))
+        left = max(0, int(min(xs) * width - grow))
+        right = min(width, int(max(xs) * width + grow))
+        if bottom <= top or right <= left:
+            return None
+        return top, right, bottom, left
+
+
+def is_raised(hand_landmarks):
+    # Image y grows downwards, so a raised hand has its fingertip above the wrist
+    return hand_landmarks.landmark[MIDDLE_FINGER_TIP].y < hand_landmarks.landmark[WRIST].y
+
+
+def analyze_hands(hands_detector, img_rgb):
+    """Run the detector once on an RGB frame and summarise the result."""
+    results = hands_detector.process(img_rgb)
+    landmarks = list(results.multi_hand_landmarks or [])
+    return HandAnalysis(
+        landmarks=landmarks,
+        raised=any(is_raised(hand) for hand in landmarks),
+        timestamp=time.time()
+    )
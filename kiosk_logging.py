@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+# Overridable from the environment so the kiosk service file can pick them
+LOG_LEVEL_ENV = "FRAS_LOG_LEVEL"    # DEBUG, INFO, WARNING, ...
+LOG_JSON_ENV = "FRAS_LOG_JSON"      # 1 for one JSON object per line
+LOG_FILE_ENV = "FRAS_LOG_FILE"
+
+_listener = None
+
+
+class RateLimitFilter(logging.Filter):
+    """At most `burst` records per message template and logger every `interval` seconds.
+
+    Only records at limit_level and below are limited: the per-frame messages
+    ("No hand detected", "Frame time") are DEBUG, while INFO events such as
+    "Attendance marked" are always kept. Limited messages are keyed on the
+    unformatted template, so they are limited regardless of their arguments.
+    The next record let through carries the number suppressed in between.
+    Records at exempt_level and above are never dropped, whatever limit_level is.
+    """
+
+    def __init__(self, interval=10.0, burst=5, exempt_level=logging.WARNING, limit_level=logging.DEBUG):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.exempt_level = exempt_level
+        self.limit_level = limit_level
+        self.suppressed_total = 0
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        record.suppressed = 0
+        if record.levelno >= self.exempt_level or record.levelno > self.limit_level:
+            return True
+
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                record.suppressed = suppressed
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            self.suppressed_total += 1
+            return False
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(threadName)s %(name)s: %(message)s")
+
+    def format(self, record):
+        text = super().format(record)
+        if getattr(record, "suppressed", 0):
+            text += f" (+{record.suppressed} similar suppressed)"
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line for the log shipper."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def setup_logging(level=None, json_output=None, log_file=None, rate_interval=10.0, rate_burst=5):
+    """Route all logging through a queue to a background writer thread; returns the rate limiter.
+
+    The calling thread only formats the message and puts it on a queue, the
+    console/file I/O happens on the QueueListener thread.
+    """
+    global _listener
+    level = level or os.getenv(LOG_LEVEL_ENV, "INFO")
+    if json_output is None:
+        json_output = os.getenv(LOG_JSON_ENV, "0") == "1"
+    log_file = log_file or os.getenv(LOG_FILE_ENV)
+
+    formatter = JsonFormatter() if json_output else TextFormatter()
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    if _listener is not None:
+        _listener.stop()
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    rate_limit = RateLimitFilter(rate_interval, rate_burst)
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(rate_limit)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    return rate_limit
+
+
+def shutdown_logging():
+    """Flush whatever is still queued."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
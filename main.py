@@ -1,25 +1,38 @@
 import os
-import sqlite3
 import datetime
+import logging
 import tkinter as tk
 import cv2
 from PIL import Image, ImageTk
-import face_recognition
 import mediapipe as mp
-import numpy as np
 import util
-import csv
+from embedding_store import get_store
+from db import get_db, create_tables, record_attendance
+from attendance_export import export_attendance_csv
+from reward_dispatcher import RewardDispatcher
+from frame_pipeline import BufferRing, DropOldestQueue, FramePipeline
+from recognition_executor import RecognitionExecutor
+from hand_analysis import analyze_hands
+from face_tracker import FaceTracker
+from frame_governor import FrameGovernor, ACTIVE
+from kiosk_logging import setup_logging
+from metrics import metrics, serve_metrics
 import threading
 import time
 import platform
 import subprocess
 from util import create_animated_emoji
 from util import show_reward_dashboard
-from util import manual_send_token_reward, mint_nft_if_eligible
 from tkinter import font as tkfont
 import re
 from util import show_student_panel
 
+log = logging.getLogger("fras.kiosk")
+
+# Size of the webcam label; preview frames are produced at exactly this size
+PREVIEW_SIZE = (600, 400)
+NFT_TOKEN_URI = "ipfs://bafkreibghqpaxdqyzhjv6tpj7pm63dy6ykxlljfj2spf57zikkx4srv6xq"
+
 
 class App:
     def __init__(self):
@@ -80,6 +93,7 @@ class App:
         self.spinner_label = tk.Label(self.main_window, text="", font=("Arial", 14), bg="#eaf6f6")
         self.spinner_label.place(x=400, y=460)
         self.spinner_running = False
+        self.spinner_thread = None
 
         # Webcam label background match
         self.webcam_label = util.get_img_label(self.main_window)
@@ -98,32 +112,83 @@ class App:
         )
 
         self.db_path = 'face_data.db'
+        self.db = get_db(self.db_path)
         self.initialize_db()
 
         self.mp_hands = mp.solutions.hands
         self.hands_detector = self.mp_hands.Hands(static_image_mode=False, max_num_hands=1, min_detection_confidence=0.7)
 
-        self.user_embeddings = self.load_user_embeddings()
+        self.face_tolerance = 0.6
+        self.embedding_store = get_store(self.db_path)
+        self.gallery = self.load_gallery()
 
         self.cap = cv2.VideoCapture(0)
 
-        self.running = True
-        self.thread = threading.Thread(target=self.process_webcam)
-        self.thread.daemon = True
-        self.thread.start()
         self.last_face_check_time = 0
-        self.face_check_interval = 3
+        # Detection is cheap next to encoding now that tracked faces are not re-encoded
+        self.face_check_interval = 0.5
         self.mp_drawing = mp.solutions.drawing_utils
         self.recently_marked = {}
         self.mark_cooldown = 60
-        self.last_seen_encoding = None
-        self.recently_marked = {}
-        self.mark_cooldown = 60
+        # Faces keep a track ID across frames; only new tracks, tracks that were lost for a detection
+        # or jumped, and periodic re-verification get encoded
+        self.face_tracker = FaceTracker(reverify_interval=2.0)
+        # Lecture-hall mode: all faces recognised in a frame are committed together
+        self.batch_attendance = True
+        # Guards gallery and face_tracker across recognition workers
+        self.match_lock = threading.Lock()
+        # Guards recently_marked; held while marking so matching in other workers isn't blocked
+        self.mark_lock = threading.Lock()
+
+        # Capture -> hand analysis -> face recognition workers, preview rendered on the Tk thread.
+        # Every queue drops its oldest frame when full so a slow stage never stalls the ones before it.
+        # Face encoding runs in worker processes; size this to the kiosk's core count
+        self.recognition_executor = RecognitionExecutor()
+        self.recognition_workers = self.recognition_executor.max_workers
+        # Preview frames are resized once at capture into a ring of 600x400 buffers and shown
+        # through a single PhotoImage; display_fps caps how many are produced and painted
+        self.display_fps = 15
+        self._next_preview_time = 0
+        self.preview_buffers = BufferRing((PREVIEW_SIZE[1], PREVIEW_SIZE[0], 3))
+        self.preview_photo = ImageTk.PhotoImage("RGB", PREVIEW_SIZE)
+        self.webcam_label.configure(image=self.preview_photo)
+        # HOG detection runs on a resized copy (1.0, 0.5 or 0.25) and, optionally, only around the raised hand
+        self.detection_scale = 0.5
+        self.detect_near_hand = True
+        self.hand_region_margin = 2.0
+        # Idle kiosks only run cheap frame differencing at a low rate; motion switches to full analysis.
+        # State and thresholds: self.frame_governor.stats(), also on /metrics
+        self.frame_governor = FrameGovernor(idle_fps=4, active_fps=20, idle_after=5.0)
+        self._last_capture_time = 0
+        self.frame_queue = DropOldestQueue(maxsize=2)
+        self.render_queue = DropOldestQueue(maxsize=2)
+        self.recognition_queue = DropOldestQueue(maxsize=2)
+
+        self.running = True
+        self.pipeline = FramePipeline()
+        self.pipeline.add_stage("capture", self.capture_webcam)
+        self.pipeline.add_stage("analysis", self.process_webcam, self.frame_queue)
+        self.pipeline.add_stage("recognition", self.recognize_faces, self.recognition_queue,
+                                workers=self.recognition_workers)
+        self.pipeline.start()
+        metrics.register_gauges(self.pipeline_gauges)
+        self.main_window.after(int(1000 / self.display_fps), self.render_webcam)
+
+    def pipeline_gauges(self):
+        """Stage queues and frame governor state for /metrics."""
+        for stage, stats in self.pipeline.stats().items():
+            for key, value in stats.items():
+                yield f"pipeline_{key}", {"stage": stage}, value
+        governor = self.frame_governor.stats()
+        yield "frame_governor_active", {}, governor["state"] == ACTIVE
+        yield "frame_governor_fps", {}, governor["fps"]
+        yield "frame_governor_motion_score", {}, governor["motion_score"]
+        yield "frame_governor_transitions", {}, governor["transitions"]
 
     def capture_register_frame(self):
         ret, frame = self.cap.read()
         if not ret:
-            print("❌ Failed to capture webcam frame")
+            log.warning("❌ Failed to capture webcam frame")
             return
 
         self.register_new_user_capture = frame.copy()
@@ -184,7 +249,8 @@ class App:
         return btn
 
     def play_success_sound(self):
-        util.play_success_sound(self)
+        # aplay/afplay block until the sound ends; keep that off the Tk thread
+        threading.Thread(target=util.play_success_sound, args=(self,), daemon=True).start()
 
     def start_spinner(self, message="⏳ Processing"):
         self.spinner_running = True
@@ -192,13 +258,15 @@ class App:
 
         def spin():
             i = 0
-            while self.spinner_running:
+            # A stop and restart within one frame must not leave the old thread spinning too
+            while self.spinner_running and self.spinner_thread is threading.current_thread():
                 spinner_text = f"{message} {spinner_frames[i % len(spinner_frames)]}"
                 self.spinner_label.config(text=spinner_text)
                 i += 1
                 time.sleep(0.1)
 
-        threading.Thread(target=spin, daemon=True).start()
+        self.spinner_thread = threading.Thread(target=spin, daemon=True)
+        self.spinner_thread.start()
 
     def stop_spinner(self):
         self.spinner_running = False
@@ -206,202 +274,260 @@ class App:
 
 
     def initialize_db(self):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-
-            # Create users table with name and wallet
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    student_id TEXT PRIMARY KEY,
-                    name TEXT,
-                    wallet TEXT,
-                    embedding BLOB
-                )
-            ''')
-
-            # Create attendance table with more fields
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS attendance (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    student_id TEXT,
-                    name TEXT,
-                    date TEXT,
-                    time TEXT,
-                    unit TEXT,
-                    FOREIGN KEY(student_id) REFERENCES users(student_id)
-                )
-            ''')
-
-    def load_user_embeddings(self):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT student_id, embedding FROM users")
-        rows = cursor.fetchall()
-        conn.close()
-
-        return [(sid, np.frombuffer(emb, dtype=np.float64)) for sid, emb in rows]
-
-    def is_hand_raised(self, frame):
-        image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = self.hands_detector.process(image_rgb)
-        if results.multi_hand_landmarks:
-            print("✅ Hand detected")
-            for hand_landmarks in results.multi_hand_landmarks:
-                wrist = hand_landmarks.landmark[0]
-                tip = hand_landmarks.landmark[12]
-                if tip.y < wrist.y:
-                    print("✅ Hand is raised")
-                    return True
-                else:
-                    print("❌ Hand detected but not raised")
+        self.db.write(create_tables)
+        self.db.migrate()
+
+        # None sends one transfer per attendance. Set to e.g. 600.0 to hold token rewards and settle
+        # them per wallet in batchReward transactions every reward_batch_window seconds (and at close);
+        # that needs RewardToken redeployed from contracts/RewardToken.sol and token_abi.json updated.
+        self.reward_batch_window = None
+        self.reward_dispatcher = RewardDispatcher(self.db, on_update=self.on_reward_update,
+                                                  batch_window=self.reward_batch_window)
+        self.reward_dispatcher.start()
+
+    def load_gallery(self):
+        # Memory-mapped from the packed embedding store instead of reading every BLOB
+        gallery = self.embedding_store.gallery(tolerance=self.face_tolerance)
+        gallery.load_or_build_index(self.db_path)
+        return gallery
+
+    def is_hand_raised(self, analysis):
+        if analysis.hand_detected:
+            if analysis.raised:
+                log.debug("✅ Hand is raised")
+                return True
+            log.debug("❌ Hand detected but not raised")
         else:
-            print("❌ No hand detected")
+            log.debug("❌ No hand detected")
         return False
 
-    def process_webcam(self):
-        while self.running:
-            start = time.time()
-            ret, frame = self.cap.read()
-            if not ret:
-                continue
+    def capture_webcam(self, _=None):
+        # Paced by the governor: idle_fps while the scene is static, active_fps otherwise
+        wait = self._last_capture_time + self.frame_governor.frame_interval() - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
 
-            self.most_recent_capture_arr = frame.copy()
+        with metrics.timer("capture"):
+            ret, frame = self.cap.read()
+        if not ret:
+            time.sleep(0.01)
+            return
+        now = time.monotonic()
+        self._last_capture_time = now
+        active = self.frame_governor.observe(frame, now)
+        metrics.inc("frames_active" if active else "frames_idle")
+
+        preview = None
+        if now >= self._next_preview_time:
+            self._next_preview_time = now + 1.0 / self.display_fps
+            # The only resize for display, straight into a preallocated buffer
+            preview = cv2.resize(frame, PREVIEW_SIZE, dst=self.preview_buffers.next(),
+                                 interpolation=cv2.INTER_AREA)
+
+        if active:
+            self.frame_queue.put((frame, preview))
+        elif preview is not None:
+            # Idle: nothing to analyse, the preview goes straight to the screen
+            cv2.cvtColor(preview, cv2.COLOR_BGR2RGB, dst=preview)
+            self.render_queue.put(preview)
+
+    def process_webcam(self, job):
+        frame, preview = job
+        start = time.time()
+
+        with metrics.timer("color_convert"):
             img_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            self.most_recent_capture_pil = Image.fromarray(img_rgb)
-
-            # ✅ Visualize hand landmarks (for debug)
-            image_for_drawing = frame.copy()
-            results = self.hands_detector.process(img_rgb)
-            if results.multi_hand_landmarks:
-                for hand_landmarks in results.multi_hand_landmarks:
-                    self.mp_drawing.draw_landmarks(image_for_drawing, hand_landmarks, self.mp_hands.HAND_CONNECTIONS)
 
-            imgtk = ImageTk.PhotoImage(image=Image.fromarray(cv2.cvtColor(image_for_drawing, cv2.COLOR_BGR2RGB)))
+        # One MediaPipe pass per frame, used for both drawing and the raised-hand gate
+        with metrics.timer("hand_detect"):
+            analysis = analyze_hands(self.hands_detector, img_rgb)
+        self.last_hand_analysis = analysis
+        if analysis.hand_detected:
+            # A student holding still with a hand up shouldn't send the kiosk idle
+            self.frame_governor.keep_active()
+
+        if preview is not None:
+            # ✅ Visualize hand landmarks (normalized coordinates, so straight onto the preview)
+            for hand_landmarks in analysis.landmarks:
+                self.mp_drawing.draw_landmarks(preview, hand_landmarks, self.mp_hands.HAND_CONNECTIONS)
+            cv2.cvtColor(preview, cv2.COLOR_BGR2RGB, dst=preview)
+            self.render_queue.put(preview)
+
+        # ✅ Hand off to face recognition if hand is raised AND enough time has passed
+        if self.is_hand_raised(analysis):
+            now = time.time()
+            if now - self.last_face_check_time > self.face_check_interval:
+                self.last_face_check_time = now
+                region = None
+                if self.detect_near_hand:
+                    region = analysis.region(img_rgb.shape, self.hand_region_margin)
+                self.recognition_queue.put((img_rgb, region))
+
+        frame_time = time.time() - start
+        metrics.observe("frame", frame_time)
+        log.debug("⏱️ Frame time: %.3fs", frame_time)
+
+    def render_webcam(self):
+        # Runs on the Tk thread, only the newest annotated frame is shown
+        if not self.running:
+            return
 
-            def update_gui():
-                self.webcam_label.imgtk = imgtk
-                self.webcam_label.configure(image=imgtk)
+        preview = self.render_queue.get_latest_nowait()
+        if preview is not None:
+            # Already RGB at label size; updates the existing PhotoImage in place
+            self.preview_photo.paste(Image.fromarray(preview))
 
-            self.webcam_label.after(0, update_gui)
+        self.main_window.after(int(1000 / self.display_fps), self.render_webcam)
 
-            # ✅ Run face recognition if hand is raised AND enough time has passed
-            if self.is_hand_raised(frame):
-                now = time.time()
-                if now - self.last_face_check_time > self.face_check_interval:
-                    self.last_face_check_time = now
+    def recognize_faces(self, job):
+        img_rgb, region = job
+        with metrics.timer("face_detect"):
+            face_locations = self.recognition_executor.detect(
+                img_rgb, detection_scale=self.detection_scale, region=region
+            )
 
-                    face_locations = face_recognition.face_locations(img_rgb)
-                    face_encodings = face_recognition.face_encodings(img_rgb, face_locations)
+        log.debug("🔍 Found %d face(s)", len(face_locations))
 
-                    print(f"🔍 Found {len(face_encodings)} face(s)")
+        now = time.time()
+        with self.match_lock:
+            tracks = self.face_tracker.update(face_locations, now)
+            to_encode = [track for track in tracks if self.face_tracker.needs_encoding(track, now)]
 
-                    for encoding in face_encodings:
-                        # ✅ Skip very similar encoding just processed
-                        if self.last_seen_encoding is not None:
-                            dist = np.linalg.norm(encoding - self.last_seen_encoding)
-                            if dist < 0.3:
-                                print("⚠️ Similar face already processed recently.")
-                                continue
+        for track in tracks:
+            if track not in to_encode:
+                log.debug("Track %d already identified as %s", track.track_id, track.student_id or "unknown")
 
-                        self.last_seen_encoding = encoding
+        if not to_encode:
+            return
 
-                        for student_id, known_encoding in self.user_embeddings:
-                            match = face_recognition.compare_faces([known_encoding], encoding)[0]
-                            if match:
-                                print(f"🎯 Face matched with {student_id}")
-                                self.mark_attendance(student_id)
-                                break
-                            else:
-                                print(f"❌ No match for {student_id}")
+        with metrics.timer("encode"):
+            _, face_encodings = self.recognition_executor.encode(
+                img_rgb, known_face_locations=[track.box for track in to_encode]
+            )
+
+        with self.match_lock:
+            # Every face in the frame is matched against the gallery in one vectorized call
+            with metrics.timer("gallery_match"):
+                matches = self.gallery.match_many(face_encodings)
+            newly_matched = []
+            for track, match in zip(to_encode, matches):
+                previous = track.student_id
+                self.face_tracker.set_identity(track, match[0] if match else None, now)
+
+                metrics.inc("matches" if match else "misses")
+                if match:
+                    student_id, distance = match
+                    log.info("🎯 Track %d matched with %s (distance %.2f)", track.track_id, student_id, distance)
+                    if student_id != previous:
+                        newly_matched.append(student_id)
+                else:
+                    log.info("❌ No match in gallery for track %d", track.track_id)
 
-            print(f"⏱️ Frame time: {time.time() - start:.2f}s")
-            time.sleep(0.05)
+        # Marking writes to the DB, outside match_lock so other workers keep matching meanwhile
+        if self.batch_attendance:
+            if newly_matched:
+                self.mark_attendance_batch(newly_matched)
+        else:
+            for student_id in newly_matched:
+                self.mark_attendance(student_id)
 
     def mark_attendance(self, student_id):
+        self.mark_attendance_batch([student_id])
+
+    def mark_attendance_batch(self, student_ids):
+        """Mark every student recognised in one frame: one transaction, one reward thread.
+
+        Called from recognition workers; UI feedback is handed to the Tk thread.
+        """
+        with self.mark_lock:
+            marked, message = self._record_marks(student_ids)
+
+        if message:
+            self.main_window.after(0, self.show_attendance_feedback, message)
+        if marked:
+            self.main_window.after(0, self.animate_success)
+            #  Blockchain Token Reward
+            self.queue_rewards(marked)
+
+    def _record_marks(self, student_ids):
+        """(marked, feedback message) after the cooldown check and one attendance transaction."""
         now = datetime.datetime.now()
 
         #  Avoid duplicate marking
-        last_mark = self.recently_marked.get(student_id)
-        if last_mark and (now - last_mark).total_seconds() < self.mark_cooldown:
-            print(f"⏳ {student_id} recently marked. Skipping.")
-            self.show_attendance_feedback(f"⏳ Already marked recently")
-            return
-
-        # Connect to DB and get name + wallet
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT name, wallet FROM users WHERE student_id = ?", (student_id,))
-        row = cursor.fetchone()
+        pending = []
+        for student_id in dict.fromkeys(student_ids):
+            last_mark = self.recently_marked.get(student_id)
+            if last_mark and (now - last_mark).total_seconds() < self.mark_cooldown:
+                log.debug("⏳ %s recently marked. Skipping.", student_id)
+                metrics.inc("cooldown_skips")
+                continue
+            pending.append(student_id)
+
+        if not pending:
+            return [], "⏳ Already marked recently"
+
+        date, time_str = now.strftime("%Y-%m-%d"), now.strftime("%H:%M:%S")
+
+        # One transaction on the shared writer for the whole batch
+        with metrics.timer("db_write"):
+            users, found, reward_state = self.db.write(record_attendance, pending, date, time_str)
+
+        for student_id in pending:
+            if student_id not in users:
+                log.warning("❌ Student ID %s not found in users table.", student_id)
+        pending = found
+        if not pending:
+            return [], None
+
+        marked = []
+        for student_id in pending:
+            name, wallet_address = users[student_id]
+            self.recently_marked[student_id] = now
+            log.info("✅ Attendance marked for %s (%s)", name, student_id)
+            count, nft_awarded = reward_state[student_id]
+            marked.append((student_id, wallet_address, count, nft_awarded))
+
+        if len(marked) == 1:
+            return marked, f"✅ Welcome {users[pending[0]][0]}!"
+        return marked, f"✅ Welcome {len(marked)} students!"
+
+    def queue_rewards(self, marked):
+        """Token (and NFT at 100 attendances) for every marked student, handed to the reward dispatcher."""
+        jobs = []
+        for student_id, wallet_address, count, nft_awarded in marked:
+            if not wallet_address:
+                log.warning("⚠️ No wallet for %s, skipping reward", student_id)
+                continue
+            jobs.append({"kind": "token", "student_id": student_id, "wallet": wallet_address, "amount": 1})
+            if count >= 100 and not nft_awarded:
+                jobs.append({"kind": "nft", "student_id": student_id, "wallet": wallet_address,
+                             "token_uri": NFT_TOKEN_URI})
 
-        if row:
-            name, wallet_address = row
-        else:
-            print(f"❌ Student ID {student_id} not found in users table.")
-            conn.close()
+        if not jobs:
             return
 
-        # Insert attendance
-        cursor.execute("""
-            INSERT INTO attendance (student_id, name, date, time, unit)
-            VALUES (?, ?, ?, ?, ?)
-        """, (
-            student_id,
-            name,
-            now.strftime("%Y-%m-%d"),
-            now.strftime("%H:%M:%S"),
-            "UnitPlaceholder"
-        ))
-
-        # Count attendance for NFT eligibility (do this *before* closing)
-        cursor.execute("SELECT COUNT(*) FROM attendance WHERE student_id=?", (student_id,))
-        count = cursor.fetchone()[0]
-
-        conn.commit()
-        conn.close()  # ✅ Close only once at the end of DB operations
-
-        self.recently_marked[student_id] = now
-        print(f"✅ Attendance marked for {name} ({student_id})")
-        self.show_attendance_feedback(f"✅ Welcome {name}!")
-        self.animate_success()
-
-        #  Blockchain Token Reward
-        # Start spinner before blockchain logic
-        self.start_spinner("🪙 Sending reward")
-
-        # Run reward logic in background to avoid UI freeze
-        def send_rewards():
-            success_token = False
-            success_nft = False
-
-            if wallet_address:
-                from util import manual_send_token_reward, mint_nft_if_eligible
-                receipt = manual_send_token_reward(wallet_address, 1)
-                success_token = bool(receipt)
-
-                if count >= 100:
-                    token_uri = "ipfs://bafkreibghqpaxdqyzhjv6tpj7pm63dy6ykxlljfj2spf57zikkx4srv6xq"
-                    nft_receipt = mint_nft_if_eligible(wallet_address, token_uri)
-                    success_nft = bool(nft_receipt)
-
-            self.stop_spinner()
-
-            if success_token:
-                print(f"🎉 Token sent to {wallet_address}")
-                self.show_attendance_feedback("📤Token sent!")
-            else:
-                print(f"❌ Failed to send token to {wallet_address}")
-                self.show_attendance_feedback("❌Token failed")
+        # Durable queue; the dispatcher submits and confirms in the background
+        self.reward_dispatcher.enqueue_many(jobs)
+        # Already spinning from an earlier batch still in flight: don't start another spinner thread
+        if not self.spinner_running and self.reward_dispatcher.pending_count(include_held=False):
+            self.start_spinner("🪙 Sending reward")
+
+    def on_reward_update(self, job, status):
+        # Called from the dispatcher threads
+        if job["kind"] == "token":
+            message = "📤Token sent!" if status == "confirmed" else "❌Token failed"
+        elif job["kind"] == "token_batch":
+            message = "📤Tokens sent!" if status == "confirmed" else "❌Token batch failed"
+        else:
+            message = "🖼️ NFT minted!" if status == "confirmed" else "❌ NFT failed."
+        log.info("%s (%s)", message, job["wallet"] or f"batch {job['id']}")
 
-            if count >= 100:
-                if success_nft:
-                    print("🖼️ NFT minted!")
-                    self.show_attendance_feedback("🖼️ NFT minted!")
-                else:
-                    print("❌ NFT minting failed.")
-                    self.show_attendance_feedback("❌ NFT failed.")
+        def update_gui():
+            self.show_attendance_feedback(message)
+            if self.reward_dispatcher.pending_count(include_held=False) == 0:
+                self.stop_spinner()
 
-        # Run in background
-        threading.Thread(target=send_rewards, daemon=True).start()
+        self.main_window.after(0, update_gui)
 
     def animate_success(self, emoji="😄"):
         create_animated_emoji(self.main_window, self.play_success_sound, emoji=emoji)
@@ -438,7 +564,7 @@ class App:
         tk.Button(code_window, text="Submit", font=("Arial", 12), command=verify_code).pack(pady=10)
 
     def show_lecturer_panel(self):
-        print("Showing Lecturer Panel")  # Debug
+        log.debug("Showing Lecturer Panel")
         self.main_window.withdraw()
         self.lecturer_window = tk.Toplevel(self.main_window)
 
@@ -446,7 +572,8 @@ class App:
             self.lecturer_window,
             self.register_new_user,
             self.show_attendance,
-            self.back_to_main_window
+            self.back_to_main_window,
+            self.reward_dispatcher
         )
 
     def register_new_user(self):
@@ -555,7 +682,25 @@ class App:
             util.msg_box('Error', 'No webcam image captured yet. Please wait for the camera to load.')
             return
 
-        embeddings = face_recognition.face_encodings(self.register_new_user_capture)
+        # Encode in the recognition pool and poll for the result so the Tk thread stays responsive
+        self.accept_button_register_new_user_window.config(state="disabled")
+        future = self.recognition_executor.submit(self.register_new_user_capture)
+        self._wait_for_register_encoding(future, name, student_id, wallet)
+
+    def _wait_for_register_encoding(self, future, name, student_id, wallet):
+        if not future.done():
+            self.register_new_user_window.after(
+                50, lambda: self._wait_for_register_encoding(future, name, student_id, wallet)
+            )
+            return
+
+        self.accept_button_register_new_user_window.config(state="normal")
+        try:
+            _, embeddings = future.result()
+        except Exception as e:
+            util.msg_box('Error', f'Face encoding failed: {e}')
+            return
+
         if len(embeddings) == 0:
             util.msg_box('Error', 'No face detected. Try again!')
             return
@@ -564,41 +709,36 @@ class App:
 
         # Save to DB...
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO users (student_id, name, wallet, embedding) VALUES (?, ?, ?, ?)",
-                       (student_id, name, wallet, embeddings.tobytes()))
-        conn.commit()
-        conn.close()
+        self.db.execute("INSERT INTO users (student_id, name, wallet, embedding) VALUES (?, ?, ?, ?)",
+                        (student_id, name, wallet, embeddings.tobytes()))
 
-        # Add to local list
-        self.user_embeddings.append((student_id, embeddings))
+        # Add to the embedding store and gallery
+        self.embedding_store.append(student_id, embeddings)
+        with self.match_lock:
+            self.gallery.add(student_id, embeddings)
+        self.gallery.save_index(self.db_path)
 
         util.msg_box('Success!', 'User was registered successfully!')
         self.register_new_user_window.destroy()
 
-    def show_attendance(self):
-        logs = util.get_attendance_logs(self.db_path)
-        if not logs:
-            util.msg_box("Attendance Log", "No attendance records found.")
+    def show_attendance(self, start_date=None, end_date=None, unit=None, student_id=None):
+        # Defaults to today's log; the range, unit and student filters are applied in SQL
+        start_date = start_date or datetime.datetime.now().strftime("%Y-%m-%d")
+        end_date = end_date or start_date
+
+        suffix = start_date if end_date == start_date else f"{start_date}_to_{end_date}"
+        if unit:
+            suffix += f"_{unit}"
+        if student_id:
+            suffix += f"_{student_id}"
+        file_path = os.path.join(os.getcwd(), f"attendance_log_{suffix}.csv")
+
+        written = export_attendance_csv(file_path, start_date, end_date, unit, student_id, db_path=self.db_path)
+        if not written:
+            util.msg_box("Attendance Log", "No attendance records for the selected period.")
             return
 
-        today = datetime.datetime.now().strftime("%Y-%m-%d")
-        today_logs = [log for log in logs if log[1] == today]  # check date column
-
-        if not today_logs:
-            util.msg_box("Attendance Log", "No attendance records for today.")
-            return
-
-        file_path = os.path.join(os.getcwd(), f"attendance_log_{today}.csv")
-
-        with open(file_path, mode="w", newline="", encoding="utf-8") as file:
-            writer = csv.writer(file)
-            writer.writerow(["Student ID", "Date", "Time"])
-            for student_id, date, time in today_logs:
-                writer.writerow([student_id, date, time])
-
-        util.msg_box("Export Successful", f"Today's attendance saved as:\n{file_path}")
+        util.msg_box("Export Successful", f"{written} attendance records saved as:\n{file_path}")
 
     def show_attendance_feedback(self, message):
         self.attendance_feedback_label.config(text=message)
@@ -610,6 +750,12 @@ class App:
 
     def on_close(self):
         self.running = False
+        self.pipeline.stop()
+        # Held token rewards become batch jobs now and are sent on the next start if not before
+        self.reward_dispatcher.settle()
+        self.reward_dispatcher.stop()
+        self.recognition_executor.shutdown()
+        self.db.close()
         if hasattr(self, 'cap'):
             self.cap.release()
         self.main_window.destroy()
@@ -619,5 +765,10 @@ class App:
 
 
 if __name__ == "__main__":
+    # Levels, JSON output and a log file come from FRAS_LOG_LEVEL / FRAS_LOG_JSON / FRAS_LOG_FILE
+    setup_logging()
+    # Optional Prometheus endpoint, e.g. FRAS_METRICS_PORT=9108 -> http://127.0.0.1:9108/metrics
+    if os.getenv("FRAS_METRICS_PORT"):
+        serve_metrics(int(os.getenv("FRAS_METRICS_PORT")))
     app = App()
     app.start()
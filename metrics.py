@@ -0,0 +1,156 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.95, 0.99)
+# Percentiles are computed over this many most recent samples per stage
+WINDOW_SIZE = 2048
+
+
+def _escape(label):
+    return str(label).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class LatencySummary:
+    """Count and sum of every observation, percentiles over a sliding window of the latest ones."""
+
+    def __init__(self, window=WINDOW_SIZE):
+        self.count = 0
+        self.total = 0.0
+        self._samples = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self._samples.append(seconds)
+
+    def quantiles(self):
+        if not self._samples:
+            return {q: 0.0 for q in QUANTILES}
+        values = np.quantile(np.fromiter(self._samples, dtype=np.float64), QUANTILES)
+        return dict(zip(QUANTILES, values.tolist()))
+
+
+class MetricsRegistry:
+    """Per-stage latency summaries and event counters, shared by the whole kiosk.
+
+    Stages used: capture, color_convert, hand_detect, frame (whole analysis
+    step), face_detect, encode, gallery_match, db_write, reward_submit, receipt_wait.
+    Counters used: matches, misses, cooldown_skips, frames_active, frames_idle.
+    Gauges are read from the components that already keep counts (frame
+    pipeline, frame governor, chain cache, RPC provider) on every snapshot.
+    """
+
+    def __init__(self, prefix="fras"):
+        self.prefix = prefix
+        self._summaries = {}
+        self._counters = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            summary = self._summaries.get(stage)
+            if summary is None:
+                summary = self._summaries[stage] = LatencySummary()
+            summary.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def register_gauges(self, collect):
+        """Add collect() -> iterable of (name, labels dict, value) to every snapshot."""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def gauges(self):
+        with self._lock:
+            collectors = list(self._collectors)
+        samples = []
+        for collect in collectors:
+            try:
+                samples.extend((name, labels, float(value)) for name, labels, value in collect())
+            except Exception:
+                # A component that is shutting down or not connected must not break the scrape
+                log.exception("⚠️ Gauge collector %r failed", collect)
+        return samples
+
+    def snapshot(self):
+        """{"stages": {stage: {count, sum, p50, p95, p99}}, "counters": {...}, "gauges": [(name, labels, value)]},
+        times in seconds."""
+        gauges = self.gauges()
+        with self._lock:
+            stages = {}
+            for stage, summary in self._summaries.items():
+                entry = {"count": summary.count, "sum": summary.total}
+                for q, value in summary.quantiles().items():
+                    entry[f"p{int(q * 100)}"] = value
+                stages[stage] = entry
+            return {"stages": stages, "counters": dict(self._counters), "gauges": gauges}
+
+    def render_prometheus(self):
+        snapshot = self.snapshot()
+        name = f"{self.prefix}_stage_latency_seconds"
+        lines = [f"# HELP {name} Latency of each kiosk pipeline stage.", f"# TYPE {name} summary"]
+        for stage, entry in sorted(snapshot["stages"].items()):
+            for q in QUANTILES:
+                lines.append(f'{name}{{stage="{stage}",quantile="{q}"}} {entry[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {entry["sum"]:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {entry["count"]}')
+        for counter, value in sorted(snapshot["counters"].items()):
+            counter_name = f"{self.prefix}_{counter}_total"
+            lines.append(f"# TYPE {counter_name} counter")
+            lines.append(f"{counter_name} {value}")
+        typed = set()
+        for gauge, labels, value in sorted(snapshot["gauges"], key=lambda sample: sample[0]):
+            gauge_name = f"{self.prefix}_{gauge}"
+            if gauge_name not in typed:
+                typed.add(gauge_name)
+                lines.append(f"# TYPE {gauge_name} gauge")
+            label_text = ",".join(f'{key}="{_escape(label)}"' for key, label in sorted(labels.items()))
+            lines.append(f"{gauge_name}{{{label_text}}} {value:g}" if label_text else f"{gauge_name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug("metrics request: " + format, *args)
+
+
+def serve_metrics(port=9108, host="127.0.0.1", registry=None):
+    """Expose the registry at http://host:port/metrics (Prometheus text format) on a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry or metrics
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    log.info("📈 Metrics at http://%s:%d/metrics", host, server.server_address[1])
+    return server
@@ -0,0 +1,154 @@
+import os
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+# --------------------- WORKER PROCESS ---------------------
+
+_face_recognition = None
+_cv2 = None
+_attached = {}
+
+
+def _init_worker():
+    # Import once per worker so dlib's detector and encoder models are loaded a single time
+    global _face_recognition, _cv2
+    import face_recognition
+    import cv2
+    _face_recognition = face_recognition
+    _cv2 = cv2
+
+
+def _attach(name):
+    shm = _attached.get(name)
+    if shm is None:
+        # Pool workers share the parent's resource tracker, the parent unlinks the segment on shutdown
+        shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = shm
+    return shm
+
+
+def _detect_faces(img, model, detection_scale, region):
+    """face_locations on a (cropped, downscaled) copy, boxes mapped back to full-frame coordinates."""
+    height, width = img.shape[:2]
+    top0, right0, bottom0, left0 = region if region else (0, width, height, 0)
+    # dlib needs a C-contiguous buffer; a region crop of the shared frame is a strided view
+    detect_img = np.ascontiguousarray(img[top0:bottom0, left0:right0])
+
+    if detection_scale != 1.0:
+        detect_img = _cv2.resize(detect_img, None, fx=detection_scale, fy=detection_scale,
+                                 interpolation=_cv2.INTER_AREA)
+
+    locations = []
+    for top, right, bottom, left in _face_recognition.face_locations(detect_img, model=model):
+        locations.append((
+            max(0, int(top / detection_scale) + top0),
+            min(width, int(right / detection_scale) + left0),
+            min(height, int(bottom / detection_scale) + top0),
+            max(0, int(left / detection_scale) + left0),
+        ))
+    return locations
+
+
+def _locate_faces(img, model, detection_scale, region):
+    locations = _detect_faces(img, model, detection_scale, region)
+    if not locations and region is not None:
+        # Nothing next to the hand, don't miss a face elsewhere in the frame
+        locations = _detect_faces(img, model, detection_scale, None)
+    return locations
+
+
+def _detect_only(shm_name, shape, dtype, model, detection_scale=1.0, region=None):
+    img = np.ndarray(shape, dtype=dtype, buffer=_attach(shm_name).buf)
+    return _locate_faces(img, model, detection_scale, region)
+
+
+def _encode_faces(shm_name, shape, dtype, known_face_locations, model, detection_scale=1.0, region=None):
+    img = np.ndarray(shape, dtype=dtype, buffer=_attach(shm_name).buf)
+    locations = known_face_locations
+    if locations is None:
+        locations = _locate_faces(img, model, detection_scale, region)
+    # Landmarks and encodings are computed on the full-resolution frame, only inside the boxes
+    encodings = _face_recognition.face_encodings(img, locations)
+    return locations, encodings
+
+
+# --------------------- PARENT SIDE ---------------------
+
+class RecognitionExecutor:
+    """Face detection + encoding in a pool of worker processes, outside the GIL.
+
+    Frames are copied once into a fixed set of shared-memory slots and only
+    the slot name travels through the pool; the workers return the (small)
+    face locations and 128-d encodings. submit() returns a Future.
+    """
+
+    def __init__(self, max_workers=None, frame_shape=(480, 640, 3)):
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        # Spawned, not forked: a fork would copy the Tk, camera and MediaPipe state of the kiosk process
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                         mp_context=multiprocessing.get_context("spawn"))
+
+        # Two slots per worker keeps every process busy while the next frame is being copied in
+        self._slot_bytes = int(np.prod(frame_shape))
+        self._slots = []
+        self._free = queue.Queue()
+        for _ in range(2 * self.max_workers):
+            slot = shared_memory.SharedMemory(create=True, size=self._slot_bytes)
+            self._slots.append(slot)
+            self._free.put(slot)
+
+    def submit(self, img_rgb, known_face_locations=None, model="hog", timeout=None,
+               detection_scale=1.0, region=None):
+        """Queue a frame for face_locations + face_encodings; blocks only when every slot is in flight.
+
+        detection_scale runs the detector on a resized copy (e.g. 0.5 or 0.25) and
+        region=(top, right, bottom, left) restricts it to part of the frame;
+        encodings are always computed at full resolution.
+        """
+        return self._submit(_encode_faces, img_rgb, timeout, known_face_locations, model, detection_scale, region)
+
+    def submit_detect(self, img_rgb, model="hog", timeout=None, detection_scale=1.0, region=None):
+        """Queue a frame for face_locations only; the Future resolves to a list of boxes."""
+        return self._submit(_detect_only, img_rgb, timeout, model, detection_scale, region)
+
+    def _submit(self, func, img_rgb, timeout, *args):
+        img = np.ascontiguousarray(img_rgb)
+        slot = self._free.get(timeout=timeout)
+
+        if img.nbytes > slot.size:
+            # Camera resolution changed, swap in a bigger segment for this slot
+            self._slots.remove(slot)
+            slot.close()
+            slot.unlink()
+            slot = shared_memory.SharedMemory(create=True, size=img.nbytes)
+            self._slots.append(slot)
+
+        np.ndarray(img.shape, dtype=img.dtype, buffer=slot.buf)[...] = img
+        try:
+            future = self._pool.submit(func, slot.name, img.shape, img.dtype.str, *args)
+        except Exception:
+            self._free.put(slot)
+            raise
+        future.add_done_callback(lambda _: self._free.put(slot))
+        return future
+
+    def encode(self, img_rgb, known_face_locations=None, model="hog", detection_scale=1.0, region=None):
+        """Blocking convenience wrapper around submit()."""
+        return self.submit(img_rgb, known_face_locations, model,
+                           detection_scale=detection_scale, region=region).result()
+
+    def detect(self, img_rgb, model="hog", detection_scale=1.0, region=None):
+        return self.submit_detect(img_rgb, model, detection_scale=detection_scale, region=region).result()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        for slot in self._slots:
+            slot.close()
+            try:
+                slot.unlink()
+            except FileNotFoundError:
+                pass
+        self._slots = []
@@ -0,0 +1,407 @@
+import logging
+import threading
+import time
+import blockchain_utils as chain
+from metrics import metrics
+
+log = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+# Wallets paid by a single batchReward transaction
+BATCH_MAX_RECIPIENTS = 100
+JOB_COLUMNS = ("id, kind, student_id, wallet, amount, token_uri, status, nonce, raw_tx, tx_hash, attempts, "
+               "updated_at, prior_tx_hashes")
+
+
+def _job(row):
+    return dict(zip([c.strip() for c in JOB_COLUMNS.split(",")], row))
+
+
+def _tx_hashes(job):
+    """Every hash this job has been signed as, newest first; any one of them may be the one mined."""
+    priors = job.get("prior_tx_hashes")
+    return [h for h in [job.get("tx_hash")] + (priors.split(",") if priors else []) if h]
+
+
+class RewardDispatcher:
+    """Single background sender for token rewards and NFT mints.
+
+    Jobs are rows in the reward_jobs table, so queued rewards survive a
+    restart. The submitter thread allocates nonces locally, signs, stores
+    the signed transaction and broadcasts without waiting for the receipt;
+    a separate poller thread confirms receipts.
+
+        queued -> signed -> submitted -> confirmed | failed
+
+    Once a job is signed it is only re-signed when none of its transactions
+    is known to the node: a failed or ambiguous broadcast (timeout, "nonce
+    too low") is first checked against the chain. A submitted transaction
+    with no receipt after stuck_after seconds is replaced at the same nonce
+    with higher fees if still pending, re-broadcast if it was dropped, and
+    re-signed with a fresh nonce only once its nonce was used up by
+    something else.
+
+    With batch_window set (seconds), token jobs are held instead of being
+    sent one transfer each. When the oldest has waited batch_window, or on
+    settle(), the held jobs are summed per wallet and turned into
+    'token_batch' jobs of up to BATCH_MAX_RECIPIENTS wallets, each settled
+    by one RewardToken.batchReward transaction. The member jobs are marked
+    'batched' and follow their batch job to confirmed or failed. Batching
+    is off by default: batchReward only exists on a RewardToken redeployed
+    from contracts/RewardToken.sol (and TOKEN_CONTRACT_ADDRESS/token_abi.json
+    pointed at it). If a batch's dry run reverts, its members go back to
+    single transfers and batching is switched off for this run.
+    """
+
+    def __init__(self, db, on_update=None, max_batch=50, submit_interval=1.0, poll_interval=5.0,
+                 batch_window=None, stuck_after=180.0):
+        self.db = db
+        self.on_update = on_update
+        self.max_batch = max_batch
+        self.submit_interval = submit_interval
+        self.poll_interval = poll_interval
+        self.batch_window = batch_window
+        self.stuck_after = stuck_after
+        self._wake = threading.Event()
+        self._running = False
+        self._threads = []
+
+    # --------------------- PRODUCERS ---------------------
+
+    def enqueue_many(self, jobs):
+        """Queue [{kind, student_id, wallet, amount, token_uri}, ...] in one transaction; returns new job ids.
+
+        NFT jobs are skipped for students that already have one queued, in flight or confirmed.
+        """
+        def insert(conn):
+            now = time.time()
+            ids = []
+            for job in jobs:
+                if job["kind"] == "nft":
+                    existing = conn.execute(
+                        "SELECT 1 FROM reward_jobs WHERE kind='nft' AND student_id=? AND status != 'failed'",
+                        (job.get("student_id"),)
+                    ).fetchone()
+                    if existing:
+                        continue
+                cursor = conn.execute(
+                    "INSERT INTO reward_jobs (kind, student_id, wallet, amount, token_uri, status, created_at, "
+                    "updated_at) VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)",
+                    (job["kind"], job.get("student_id"), job["wallet"], job.get("amount", 1),
+                     job.get("token_uri"), now, now)
+                )
+                ids.append(cursor.lastrowid)
+            return ids
+
+        ids = self.db.write(insert)
+        self._wake.set()
+        return ids
+
+    def enqueue(self, kind, wallet, student_id=None, amount=1, token_uri=None):
+        ids = self.enqueue_many([{"kind": kind, "wallet": wallet, "student_id": student_id,
+                                  "amount": amount, "token_uri": token_uri}])
+        return ids[0] if ids else None
+
+    def pending_count(self, include_held=True):
+        """Jobs not yet confirmed or failed; include_held=False leaves out token jobs waiting for a batch."""
+        sql = "SELECT COUNT(*) FROM reward_jobs WHERE status IN ('queued', 'signed', 'submitted')"
+        if not include_held and self.batch_window is not None:
+            sql += " AND NOT (kind='token' AND status='queued')"
+        return self.db.query_one(sql)[0]
+
+    def settle(self):
+        """Close the batching window now (e.g. end of a session) instead of waiting for batch_window."""
+        if self.batch_window is None:
+            return []
+        batch_ids = self._form_batches()
+        self._wake.set()
+        return batch_ids
+
+    # --------------------- LIFECYCLE ---------------------
+
+    def start(self):
+        # Connects in the background; jobs stay queued until the chain is reachable
+        chain.client.start()
+        self._running = True
+        for name, target in (("reward-submitter", self._submit_loop), ("reward-poller", self._poll_loop)):
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+
+    # --------------------- SUBMITTER ---------------------
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{k}=?" for k in fields)
+        self.db.write(lambda conn: conn.execute(
+            f"UPDATE reward_jobs SET {assignments} WHERE id=?", list(fields.values()) + [job_id]
+        ))
+
+    def _submit_loop(self):
+        while self._running:
+            if not chain.client.is_ready():
+                chain.client.wait_ready(self.submit_interval)
+                continue
+
+            held = ""
+            if self.batch_window is not None:
+                if self._batch_due():
+                    self._form_batches()
+                held = " AND NOT (kind='token' AND status='queued')"
+
+            jobs = [_job(r) for r in self.db.query(
+                f"SELECT {JOB_COLUMNS} FROM reward_jobs WHERE status IN ('queued', 'signed'){held} "
+                "ORDER BY id LIMIT ?",
+                (self.max_batch,)
+            )]
+            if not jobs:
+                self._wake.wait(self.submit_interval)
+                self._wake.clear()
+                continue
+
+            for job in jobs:
+                if not self._running:
+                    return
+                if not self._submit(job):
+                    # Back off before retrying so a dead RPC endpoint isn't hammered
+                    time.sleep(self.submit_interval)
+                    break
+
+    def _batch_due(self):
+        oldest = self.db.query_one(
+            "SELECT MIN(created_at) FROM reward_jobs WHERE kind='token' AND status='queued'"
+        )[0]
+        return oldest is not None and time.time() - oldest >= self.batch_window
+
+    def _form_batches(self):
+        """Group every held token job into token_batch jobs, one wallet never split across batches."""
+        def group(conn):
+            totals = conn.execute(
+                "SELECT wallet, SUM(amount) FROM reward_jobs WHERE kind='token' AND status='queued' "
+                "GROUP BY wallet ORDER BY wallet"
+            ).fetchall()
+            now = time.time()
+            batch_ids = []
+            for start in range(0, len(totals), BATCH_MAX_RECIPIENTS):
+                chunk = totals[start:start + BATCH_MAX_RECIPIENTS]
+                cursor = conn.execute(
+                    "INSERT INTO reward_jobs (kind, amount, status, created_at, updated_at) "
+                    "VALUES ('token_batch', ?, 'queued', ?, ?)",
+                    (sum(amount for _, amount in chunk), now, now)
+                )
+                batch_id = cursor.lastrowid
+                conn.executemany(
+                    "UPDATE reward_jobs SET status='batched', batch_id=?, updated_at=? "
+                    "WHERE kind='token' AND status='queued' AND wallet=?",
+                    [(batch_id, now, wallet) for wallet, _ in chunk]
+                )
+                batch_ids.append(batch_id)
+            return batch_ids
+
+        batch_ids = self.db.write(group)
+        if batch_ids:
+            log.info("📦 Settling held token rewards in %d batch transaction(s)", len(batch_ids))
+        return batch_ids
+
+    def _unbatch(self, job, reason):
+        """The batch would revert: send its members as single transfers and stop batching."""
+        self.batch_window = None
+
+        def split(conn):
+            now = time.time()
+            conn.execute("UPDATE reward_jobs SET status='queued', batch_id=NULL, updated_at=? WHERE batch_id=?",
+                         (now, job["id"]))
+            conn.execute("UPDATE reward_jobs SET status='failed', error=?, updated_at=? WHERE id=?",
+                         (reason, now, job["id"]))
+
+        self.db.write(split)
+        log.warning("⚠️ batchReward dry run reverted (%s); is the token contract redeployed with it? "
+                    "Sending batch %d as single transfers", reason, job["id"])
+
+    def _build(self, job, nonce):
+        if job["kind"] == "token":
+            return chain.build_token_transfer(job["wallet"], job["amount"], nonce)
+        if job["kind"] == "token_batch":
+            totals = self.db.query(
+                "SELECT wallet, SUM(amount) FROM reward_jobs WHERE batch_id=? GROUP BY wallet ORDER BY wallet",
+                (job["id"],)
+            )
+            return chain.build_token_batch_transfer([w for w, _ in totals], [a for _, a in totals], nonce)
+        if job["kind"] == "nft":
+            return chain.build_nft_mint(job["wallet"], job["token_uri"] or chain.token_uri, nonce)
+        raise ValueError(f"Unknown reward job kind: {job['kind']}")
+
+    def _submit(self, job):
+        with metrics.timer("reward_submit"):
+            return self._submit_job(job)
+
+    def _submit_job(self, job):
+        try:
+            if job["status"] == "queued":
+                nonce = chain.nonces.allocate()
+                raw_tx, tx_hash = chain.sign_transaction(self._build(job, nonce))
+                # Persist the signed transaction first: after a crash it is re-broadcast, never re-signed
+                self._update(job["id"], status="signed", nonce=nonce, raw_tx=raw_tx, tx_hash=tx_hash)
+                job.update(status="signed", nonce=nonce, raw_tx=raw_tx, tx_hash=tx_hash)
+
+            chain.broadcast_raw_transaction(job["raw_tx"])
+            self._update(job["id"], status="submitted")
+            log.info("🚀 Reward job %d (%s) submitted with nonce %d", job["id"], job["kind"], job["nonce"])
+            return True
+        except Exception as e:
+            message = str(e)
+            if "already known" in message.lower():
+                # A previous broadcast of the same signed transaction made it to the node
+                self._update(job["id"], status="submitted")
+                return True
+
+            if isinstance(e, chain.ChainUnavailable):
+                # Not the job's fault, leave it as it was until the client reconnects
+                chain.nonces.resync()
+                return False
+
+            if chain.is_transport_error(e):
+                # Every endpoint failed even after retries; same as unavailable, no attempt is counted.
+                # A signed job stays signed and the same transaction is broadcast again later.
+                chain.nonces.resync()
+                chain.client.report_failure()
+                log.warning("⚠️ Reward job %d not submitted, RPC unreachable: %s", job["id"], message)
+                return False
+
+            if isinstance(e, chain.BatchRejected):
+                # Rejected before signing, the allocated nonce was never used
+                chain.nonces.resync()
+                self._unbatch(job, message)
+                self._wake.set()
+                return False
+
+            if job.get("tx_hash"):
+                # The broadcast may have reached the node anyway (timeout after accepting it, or a
+                # re-broadcast answered with "nonce too low" because it was already mined)
+                try:
+                    known = self._any_known(job)
+                except Exception as lookup_error:
+                    # Can't tell, keep the signed transaction and try the same one again later
+                    log.warning("⚠️ Reward job %d broadcast failed (%s) and its status is unknown: %s",
+                                job["id"], message, lookup_error)
+                    chain.client.report_failure()
+                    return False
+                if known:
+                    self._update(job["id"], status="submitted")
+                    log.info("🚀 Reward job %d (%s) already on the node: %s", job["id"], job["kind"], message)
+                    return True
+
+            # None of the job's transactions exist, so signing it again can't pay twice
+            attempts = job["attempts"] + 1
+            chain.nonces.resync()
+            chain.client.report_failure()
+            status = "failed" if attempts >= MAX_ATTEMPTS else "queued"
+            # Back to queued means a fresh nonce and signature on the next attempt
+            self._update(job["id"], status=status, attempts=attempts, error=message,
+                         raw_tx=None, tx_hash=None, nonce=None, prior_tx_hashes=None)
+            log.warning("🚨 Reward job %d submission failed (%d/%d): %s", job["id"], attempts, MAX_ATTEMPTS, message)
+            if status == "failed":
+                job["tx_hash"] = None
+                self.db.write(self._finish_members, job, "failed")
+                self._notify(job, "failed")
+            return False
+
+    @staticmethod
+    def _any_known(job):
+        return any(chain.lookup_transaction(h) is not None for h in _tx_hashes(job))
+
+    # --------------------- RECEIPT POLLER ---------------------
+
+    def _poll_loop(self):
+        while self._running:
+            if not chain.client.is_ready():
+                chain.client.wait_ready(self.poll_interval)
+                continue
+
+            jobs = [_job(r) for r in self.db.query(
+                f"SELECT {JOB_COLUMNS} FROM reward_jobs WHERE status='submitted' ORDER BY id"
+            )]
+            for job in jobs:
+                try:
+                    receipt = self._find_receipt(job)
+                    if receipt is None:
+                        if job["updated_at"] and time.time() - job["updated_at"] > self.stuck_after:
+                            self._unstick(job)
+                        continue
+                except Exception as e:
+                    log.warning("⚠️ Receipt check failed for job %d: %s", job["id"], e)
+                    chain.client.report_failure()
+                    break
+
+                status = "confirmed" if receipt.status == 1 else "failed"
+                if job["updated_at"]:
+                    # updated_at was last set when the job was marked submitted
+                    metrics.observe("receipt_wait", time.time() - job["updated_at"])
+                self._confirm(job, status)
+
+            time.sleep(self.poll_interval)
+
+    @staticmethod
+    def _find_receipt(job):
+        """Receipt of whichever of the job's transactions was mined; sets job["tx_hash"] to it."""
+        for tx_hash in _tx_hashes(job):
+            receipt = chain.get_receipt(tx_hash)
+            if receipt is not None:
+                job["tx_hash"] = tx_hash
+                return receipt
+        return None
+
+    def _unstick(self, job):
+        """A submitted job without a receipt for stuck_after seconds; every later nonce waits on it."""
+        pending = chain.lookup_transaction(job["tx_hash"])
+        if pending is not None:
+            # Still in the mempool, most likely underpriced: replace it at the same nonce
+            txn = chain.bump_fees(self._build(job, job["nonce"]), pending)
+            raw_tx, tx_hash = chain.sign_transaction(txn)
+            self._update(job["id"], status="signed", raw_tx=raw_tx, tx_hash=tx_hash,
+                         prior_tx_hashes=",".join(_tx_hashes(job)))
+            log.warning("⏫ Reward job %d stuck, replacing %s with %s", job["id"], job["tx_hash"], tx_hash)
+        elif job["nonce"] < chain.mined_nonce():
+            # The nonce went to another transaction; make sure none of ours was the one mined
+            if self._find_receipt(job) is not None or self._any_known(job):
+                return
+            chain.nonces.resync()
+            self._update(job["id"], status="queued", raw_tx=None, tx_hash=None, nonce=None, prior_tx_hashes=None,
+                         error="nonce used by another transaction")
+            log.warning("🔁 Reward job %d was never mined and its nonce is used up, re-signing", job["id"])
+        else:
+            # Dropped from the mempool with its nonce still free: broadcast the same transaction again
+            self._update(job["id"], status="signed")
+            log.warning("🔁 Reward job %d dropped from the mempool, re-broadcasting", job["id"])
+        self._wake.set()
+
+    def _confirm(self, job, status):
+        def record(conn):
+            conn.execute("UPDATE reward_jobs SET status=?, tx_hash=?, updated_at=? WHERE id=?",
+                         (status, job["tx_hash"], time.time(), job["id"]))
+            if job["kind"] == "nft" and status == "confirmed" and job["student_id"]:
+                conn.execute("UPDATE users SET nft_awarded=1 WHERE student_id=?", (job["student_id"],))
+            self._finish_members(conn, job, status)
+
+        self.db.write(record)
+        log.info("%s Reward job %d %s: %s", "✅" if status == "confirmed" else "❌", job["id"], status, job["tx_hash"])
+        self._notify(job, status)
+
+    @staticmethod
+    def _finish_members(conn, job, status):
+        if job["kind"] == "token_batch":
+            conn.execute(
+                "UPDATE reward_jobs SET status=?, tx_hash=?, updated_at=? WHERE batch_id=?",
+                (status, job["tx_hash"], time.time(), job["id"])
+            )
+
+    def _notify(self, job, status):
+        if self.on_update:
+            try:
+                self.on_update(job, status)
+            except Exception as e:
+                log.exception("⚠️ Reward update callback failed: %s", e)
@@ -0,0 +1,153 @@
+import logging
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+from web3.providers.base import BaseProvider
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_POOL_SIZE = 8
+# HTTP statuses worth retrying on the same or another endpoint
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _retryable(error):
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in RETRY_STATUSES
+    return False
+
+
+def pooled_session(pool_size=DEFAULT_POOL_SIZE):
+    """requests.Session keeping up to pool_size keep-alive connections to one host; retries are ours."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class EndpointStats:
+    def __init__(self, name):
+        self.name = name
+        self.requests = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.down_until = 0.0
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_ms": round(1000 * self.total_seconds / self.requests, 1) if self.requests else 0.0,
+            "down": self.down_until > time.monotonic(),
+        }
+
+
+class FailoverProvider(BaseProvider):
+    """Web3 provider over several endpoints with retries, backoff and failover.
+
+    Requests go to the first endpoint that isn't cooling down. Transport
+    errors (connection refused, timeouts, 429/5xx) mark the endpoint down for
+    cooldown seconds and the request is retried on the next one after an
+    exponential backoff with full jitter; JSON-RPC errors (reverts, "already
+    known", ...) are returned to web3 untouched. Any web3 provider can be an
+    endpoint, e.g. EthereumTesterProvider for a local stand-in node (its result
+    formatting middleware then has to be on the FailoverProvider, see tests/).
+    """
+
+    def __init__(self, providers, names=None, max_retries=4, backoff_base=0.25, backoff_cap=8.0, cooldown=30.0):
+        super().__init__()
+        if not providers:
+            raise ValueError("FailoverProvider needs at least one endpoint")
+        self.providers = list(providers)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.cooldown = cooldown
+        self.retries = 0
+        self.failovers = 0
+        self.methods = {}
+        self._endpoints = [EndpointStats(name) for name in (names or [str(p) for p in self.providers])]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_urls(cls, urls, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE, **kwargs):
+        """One pooled, keep-alive HTTPProvider per URL.
+
+        HTTPProvider's own retries are switched off (exception_retry_configuration=None):
+        they would re-post timed-out requests, eth_sendRawTransaction included, before
+        failover ever sees the error.
+        """
+        providers = [
+            Web3.HTTPProvider(url, request_kwargs={"timeout": timeout}, session=pooled_session(pool_size),
+                              exception_retry_configuration=None)
+            for url in urls
+        ]
+        return cls(providers, names=list(urls), **kwargs)
+
+    def _pick(self, exclude=None):
+        now = time.monotonic()
+        order = range(len(self.providers))
+        healthy = [i for i in order if self._endpoints[i].down_until <= now and i != exclude]
+        if healthy:
+            return healthy[0]
+        # Everything is cooling down, try the one that has been down longest
+        return min(order, key=lambda i: self._endpoints[i].down_until)
+
+    def make_request(self, method, params):
+        with self._lock:
+            self.methods[method] = self.methods.get(method, 0) + 1
+            index = self._pick()
+
+        for attempt in range(self.max_retries + 1):
+            endpoint = self._endpoints[index]
+            started = time.monotonic()
+            try:
+                response = self.providers[index].make_request(method, params)
+            except Exception as e:
+                with self._lock:
+                    endpoint.requests += 1
+                    endpoint.errors += 1
+                    endpoint.total_seconds += time.monotonic() - started
+                    if not _retryable(e) or attempt == self.max_retries:
+                        raise
+                    endpoint.down_until = time.monotonic() + self.cooldown
+                    next_index = self._pick(exclude=index)
+                    self.retries += 1
+                    if next_index != index:
+                        self.failovers += 1
+                log.warning("⚠️ RPC %s failed on %s (%s), retrying on %s",
+                            method, endpoint.name, e, self._endpoints[next_index].name)
+                index = next_index
+                time.sleep(random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt)))
+                continue
+
+            with self._lock:
+                endpoint.requests += 1
+                endpoint.total_seconds += time.monotonic() - started
+                endpoint.down_until = 0.0
+            return response
+
+    def is_connected(self, show_traceback=False):
+        try:
+            response = self.make_request("web3_clientVersion", [])
+        except Exception:
+            if show_traceback:
+                raise
+            return False
+        return "error" not in response
+
+    def stats(self):
+        with self._lock:
+            return {
+                "retries": self.retries,
+                "failovers": self.failovers,
+                "methods": dict(self.methods),
+                "endpoints": {e.name: e.as_dict() for e in self._endpoints},
+            }
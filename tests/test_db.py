@@ -0,0 +1,173 @@
+import threading
+import pytest
+
+import db as db_module
+from db import Database, MIGRATIONS, create_tables, record_attendance
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "face_data.db"))
+    database.write(create_tables)
+    database.migrate()
+    yield database
+    database.close()
+
+
+def add_user(conn, student_id):
+    conn.execute("INSERT INTO users (student_id, name) VALUES (?, ?)", (student_id, student_id))
+    return student_id
+
+
+def fail_after_insert(conn, student_id):
+    add_user(conn, student_id)
+    raise ValueError("job failed")
+
+
+def trace_commits(db):
+    """Statements the writer connection runs from now on."""
+    statements = []
+    db.write(lambda conn: conn.set_trace_callback(statements.append))
+    statements.clear()
+    return statements
+
+
+def hold_writer(db):
+    """Block the writer thread until the returned event is set, so later writes queue up."""
+    release, holding = threading.Event(), threading.Event()
+    db.submit_write(lambda conn: holding.set() or release.wait(5))
+    assert holding.wait(5)
+    return release
+
+
+def students(db):
+    return [row[0] for row in db.query("SELECT student_id FROM users ORDER BY student_id")]
+
+
+# --------------------- WRITER (user-010) ---------------------
+
+def test_write_returns_the_result_and_is_visible_to_readers(db):
+    assert db.write(add_user, "S1") == "S1"
+    result = {}
+    reader = threading.Thread(target=lambda: result.update(rows=students(db)))
+    reader.start()
+    reader.join()
+    assert result["rows"] == ["S1"]
+
+
+def test_queued_writes_are_group_committed(db):
+    statements = trace_commits(db)
+    release = hold_writer(db)
+    futures = [db.submit_write(add_user, f"S{i:02d}") for i in range(20)]
+    release.set()
+
+    assert [f.result(5) for f in futures] == [f"S{i:02d}" for i in range(20)]
+    # One commit for the job holding the writer, one for all twenty queued behind it
+    assert statements.count("COMMIT") == 2
+    assert len(students(db)) == 20
+
+
+def test_failing_job_rolls_back_only_its_own_savepoint(db):
+    statements = trace_commits(db)
+    release = hold_writer(db)
+    before = db.submit_write(add_user, "S1")
+    failing = db.submit_write(fail_after_insert, "S2")
+    after = db.submit_write(add_user, "S3")
+    release.set()
+
+    assert before.result(5) == "S1"
+    assert after.result(5) == "S3"
+    with pytest.raises(ValueError):
+        failing.result(5)
+    assert students(db) == ["S1", "S3"]
+    assert statements.count("COMMIT") == 2
+    assert "ROLLBACK TO job" in statements
+
+
+def test_write_from_inside_a_write_job_joins_its_transaction(db):
+    def outer(conn):
+        add_user(conn, "S1")
+        return db.write(add_user, "S2")
+
+    assert db.write(outer) == "S2"
+    assert students(db) == ["S1", "S2"]
+
+
+
+# --------------------- MIGRATIONS (user-011) ---------------------
+
+def user_version(db):
+    return db.query_one("PRAGMA user_version")[0]
+
+
+def tables(db):
+    return {row[0] for row in db.query("SELECT name FROM sqlite_master WHERE type='table'")}
+
+
+def test_migrate_runs_each_migration_once(db):
+    assert user_version(db) == len(MIGRATIONS)
+    assert db.migrate() == 0
+    assert user_version(db) == len(MIGRATIONS)
+
+
+def test_failing_migration_rolls_back_alone(db, monkeypatch):
+    def good(conn):
+        conn.execute("CREATE TABLE good_migration (id INTEGER)")
+
+    def bad(conn):
+        conn.execute("CREATE TABLE bad_migration (id INTEGER)")
+        raise RuntimeError("migration failed")
+
+    monkeypatch.setattr(db_module, "MIGRATIONS", MIGRATIONS + [good, bad])
+    with pytest.raises(RuntimeError):
+        db.migrate()
+
+    assert user_version(db) == len(MIGRATIONS) + 1
+    assert "good_migration" in tables(db)
+    assert "bad_migration" not in tables(db)
+    # The writer is unaffected
+    assert db.write(add_user, "S1") == "S1"
+
+
+def attendance_days(db):
+    return dict(db.query("SELECT student_id, attendance_days FROM users"))
+
+
+def test_migrations_backfill_attendance_days_and_add_reward_columns(tmp_path):
+    database = Database(str(tmp_path / "old.db"))
+    try:
+        # A database from before the migrations: users and attendance rows, no counters
+        database.write(create_tables)
+        for student_id in ("S1", "S2", "S3"):
+            database.write(add_user, student_id)
+        database.executemany("INSERT INTO attendance (student_id, date) VALUES (?, ?)",
+                             [("S1", "2025-05-01"), ("S1", "2025-05-02"), ("S2", "2025-05-01")])
+
+        assert database.migrate() == len(MIGRATIONS)
+        assert attendance_days(database) == {"S1": 2, "S2": 1, "S3": 0}
+        assert dict(database.query("SELECT student_id, nft_awarded FROM users")) == {"S1": 0, "S2": 0, "S3": 0}
+        columns = {row[1]: row for row in database.query("PRAGMA table_info(reward_jobs)")}
+        # token_batch jobs have no single wallet
+        assert columns["wallet"][3] == 0
+        assert {"batch_id", "prior_tx_hashes"} <= set(columns)
+    finally:
+        database.close()
+
+
+def test_triggers_keep_attendance_days_in_step(db):
+    for student_id in ("S1", "S2"):
+        db.write(add_user, student_id)
+
+    users, found, reward_state = db.write(record_attendance, ["S1", "S2", "S9"], "2025-05-01", "09:00:00")
+    assert found == ["S1", "S2"]
+    assert reward_state == {"S1": (1, 0), "S2": (1, 0)}
+    _, _, reward_state = db.write(record_attendance, ["S1"], "2025-05-02", "09:00:00")
+    assert reward_state == {"S1": (2, 0)}
+    assert attendance_days(db) == {"S1": 2, "S2": 1}
+
+    db.execute("UPDATE attendance SET student_id='S2' WHERE student_id='S1' AND date='2025-05-02'")
+    assert attendance_days(db) == {"S1": 1, "S2": 2}
+
+    db.execute("DELETE FROM attendance WHERE student_id='S2'")
+    assert attendance_days(db) == {"S1": 1, "S2": 0}
+    assert attendance_days(db)["S1"] == db.query_one("SELECT COUNT(*) FROM attendance WHERE student_id='S1'")[0]
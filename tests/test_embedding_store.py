@@ -0,0 +1,59 @@
+import os
+import numpy as np
+import pytest
+
+from db import get_db, create_tables
+from embedding_store import EmbeddingStore, EMBEDDING_DIM
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = str(tmp_path / "face_data.db")
+    get_db(path).write(create_tables)
+    store = EmbeddingStore(path)
+    yield store
+    store.db.close()
+
+
+def add_user(store, student_id, embedding):
+    store.db.execute("INSERT INTO users (student_id, embedding) VALUES (?, ?)",
+                     (student_id, embedding.tobytes()))
+
+
+def matrix_files(store):
+    directory = os.path.dirname(store.index_path)
+    return sorted(name for name in os.listdir(directory) if name.endswith(".f64"))
+
+
+def test_each_version_gets_its_own_matrix_file(store):
+    first = np.full(EMBEDDING_DIM, 0.1)
+    add_user(store, "S1", first)
+    store.append("S1", first)
+    held = store.gallery()
+    held_matrix = store.matrix
+
+    second = np.full(EMBEDDING_DIM, 0.2)
+    add_user(store, "S2", second)
+    store.append("S2", second)
+
+    assert store.matrix_path != held_matrix.filename
+    assert store.student_ids == ["S1", "S2"]
+    np.testing.assert_array_equal(store.matrix, [first, second])
+    # The gallery built before the append still reads the version it mapped
+    assert held.student_ids == ["S1"]
+    np.testing.assert_array_equal(held_matrix, [first])
+    assert matrix_files(store) == [os.path.basename(store.matrix_path)]
+
+
+def test_reopening_maps_the_indexed_version_or_rebuilds(store):
+    embedding = np.full(EMBEDDING_DIM, 0.3)
+    add_user(store, "S1", embedding)
+    # Changed behind the store's back: the next open rebuilds from the table
+    assert store.refresh_if_stale()
+    path = store.matrix_path
+
+    reopened = EmbeddingStore(store.db_path)
+    assert reopened.matrix_path == path
+    assert reopened.student_ids == ["S1"]
+    np.testing.assert_array_equal(reopened.matrix, [embedding])
+    assert not any(name.endswith(".tmp") for name in os.listdir(os.path.dirname(path)))
@@ -0,0 +1,43 @@
+from face_tracker import FaceTracker
+
+BOX = (100, 200, 200, 100)
+
+
+def identified(tracker, boxes, now, student_id="S1"):
+    track, = tracker.update(boxes, now)
+    tracker.set_identity(track, student_id, now)
+    return track
+
+
+def test_steady_track_keeps_its_identity_until_reverification():
+    tracker = FaceTracker(reverify_interval=2.0)
+    track = identified(tracker, [BOX], 0.0)
+
+    same, = tracker.update([(102, 202, 202, 102)], 0.5)
+    assert same is track
+    assert not tracker.needs_encoding(same, 0.5)
+    assert tracker.needs_encoding(same, 2.0)
+
+
+def test_track_missed_by_a_detection_is_reverified():
+    tracker = FaceTracker()
+    track = identified(tracker, [BOX], 0.0)
+
+    assert tracker.update([], 0.5) == []
+    back, = tracker.update([BOX], 1.0)
+    assert back is track
+    assert tracker.needs_encoding(back, 1.0)
+
+    tracker.set_identity(back, "S2", 1.0)
+    assert back.student_id == "S2"
+    assert not tracker.needs_encoding(back, 1.5)
+
+
+def test_jumping_box_is_reverified():
+    tracker = FaceTracker()
+    track = identified(tracker, [BOX], 0.0)
+
+    # Still overlaps enough to be associated, but not a face holding still
+    moved, = tracker.update([(120, 220, 220, 120)], 0.5)
+    assert moved is track
+    assert tracker.needs_encoding(moved, 0.5)
@@ -0,0 +1,17 @@
+from metrics import MetricsRegistry
+
+
+def test_registered_gauges_are_rendered_and_a_failing_collector_is_skipped():
+    registry = MetricsRegistry()
+    registry.register_gauges(lambda: [("pipeline_queued", {"stage": "analysis"}, 2),
+                                      ("pipeline_queued", {"stage": "recognition"}, 0),
+                                      ("frame_governor_active", {}, True)])
+    registry.register_gauges(lambda: 1 / 0)
+
+    assert registry.snapshot()["gauges"] == [("pipeline_queued", {"stage": "analysis"}, 2.0),
+                                             ("pipeline_queued", {"stage": "recognition"}, 0.0),
+                                             ("frame_governor_active", {}, 1.0)]
+    lines = registry.render_prometheus().splitlines()
+    assert lines.count("# TYPE fras_pipeline_queued gauge") == 1
+    assert 'fras_pipeline_queued{stage="analysis"} 2' in lines
+    assert "fras_frame_governor_active 1" in lines
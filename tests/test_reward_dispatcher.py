@@ -0,0 +1,236 @@
+import os
+import time
+import threading
+import pytest
+
+pytest.importorskip("web3")
+pytest.importorskip("eth_tester")
+pytest.importorskip("dotenv")
+requests = pytest.importorskip("requests")
+
+from eth_account import Account
+from web3 import Web3
+from web3.providers.base import BaseProvider
+import blockchain_utils as chain
+from db import Database, create_tables
+from reward_dispatcher import RewardDispatcher, JOB_COLUMNS, _job
+from rpc_provider import FailoverProvider
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Runtime code that answers every call with the word 1: stands in for both the token and the NFT contract
+ACCEPT_ALL_INITCODE = "0x69600160005260206000f3600052600a6016f3"
+
+
+class SwitchableEndpoint(BaseProvider):
+    """Passes requests to a tester node, failing the methods in `failing` like an unreachable RPC."""
+
+    def __init__(self, provider, caller):
+        super().__init__()
+        self.provider = provider
+        self.caller = caller
+        self.failing = set()
+        self.failures = 0
+
+    def make_request(self, method, params):
+        if method in self.failing:
+            self.failures += 1
+            raise requests.ConnectionError("connection refused")
+        if method == "eth_call" and "from" not in params[0]:
+            # eth-tester insists on a sender for calls, real nodes don't
+            params = [dict(params[0], **{"from": self.caller})] + list(params[1:])
+        return self.provider.make_request(method, params)
+
+
+class FailoverToTester(FailoverProvider):
+    """FailoverProvider in front of a tester node, with the middleware that turns eth-tester's
+    snake_case results (gas_price, base_fee_per_gas, ...) into the JSON-RPC field names."""
+
+    _middleware = Web3.EthereumTesterProvider._middleware
+    request_func = Web3.EthereumTesterProvider.request_func
+
+
+class Crash(BaseException):
+    """Escapes the submitter's error handling, as if the process died mid-submission."""
+
+
+@pytest.fixture
+def node(monkeypatch):
+    tester = Web3.EthereumTesterProvider()
+    w3 = Web3(tester)
+    funder = w3.eth.accounts[0]
+    sender = Account.create()
+    w3.eth.send_transaction({"from": funder, "to": sender.address, "value": 10 ** 20})
+    deployed = w3.eth.get_transaction_receipt(w3.eth.send_transaction({"from": funder, "data": ACCEPT_ALL_INITCODE}))
+
+    endpoint = SwitchableEndpoint(tester, funder)
+    provider = FailoverToTester([endpoint], names=["tester"], max_retries=1, backoff_base=0.0)
+    # The ABIs are read from the working directory
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(chain, "PRIVATE_KEY", sender.key)
+    monkeypatch.setattr(chain, "PUBLIC_KEY", sender.address)
+    monkeypatch.setattr(chain, "NFT_CONTRACT_ADDRESS", deployed.contractAddress)
+    monkeypatch.setattr(chain, "TOKEN_CONTRACT_ADDRESS", deployed.contractAddress)
+    monkeypatch.setattr(chain, "client", chain.ChainClient(provider=provider, health_interval=0.5))
+    monkeypatch.setattr(chain, "nonces", chain.NonceManager())
+    monkeypatch.setattr(chain, "cache", chain.ChainCache())
+
+    node = type("Node", (), {})()
+    node.w3, node.tester, node.endpoint, node.sender = w3, tester.ethereum_tester, endpoint, sender
+    return node
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "face_data.db"))
+    database.write(create_tables)
+    database.migrate()
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def dispatchers():
+    started = []
+
+    def start(db, **kwargs):
+        kwargs.setdefault("submit_interval", 0.05)
+        kwargs.setdefault("poll_interval", 0.05)
+        dispatcher = RewardDispatcher(db, **kwargs)
+        dispatcher.start()
+        started.append(dispatcher)
+        return dispatcher
+
+    yield start
+    for dispatcher in started:
+        dispatcher.stop()
+    for dispatcher in started:
+        for thread in dispatcher._threads:
+            thread.join(5)
+
+
+def job(db, job_id):
+    return _job(db.query_one(f"SELECT {JOB_COLUMNS} FROM reward_jobs WHERE id=?", (job_id,)))
+
+
+def wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return
+        time.sleep(0.02)
+    raise AssertionError("timed out waiting for the dispatcher")
+
+
+def wallet():
+    return Account.create().address
+
+
+def test_job_is_signed_submitted_and_confirmed(node, db, dispatchers):
+    node.tester.disable_auto_mine_transactions()
+    dispatcher = dispatchers(db)
+    job_id = dispatcher.enqueue("token", wallet(), student_id="S1")
+
+    wait_for(lambda: job(db, job_id)["status"] == "submitted")
+    submitted = job(db, job_id)
+    assert submitted["nonce"] == 0
+    assert submitted["attempts"] == 0
+    assert node.w3.eth.get_transaction(submitted["tx_hash"])["nonce"] == 0
+
+    node.tester.mine_blocks(1)
+    wait_for(lambda: job(db, job_id)["status"] == "confirmed")
+    assert job(db, job_id)["tx_hash"] == submitted["tx_hash"]
+    assert node.w3.eth.get_transaction_count(node.sender.address) == 1
+
+
+def test_transport_failure_does_not_count_an_attempt(node, db, dispatchers):
+    node.endpoint.failing.add("eth_sendRawTransaction")
+    dispatcher = dispatchers(db)
+    job_id = dispatcher.enqueue("token", wallet(), student_id="S1")
+
+    wait_for(lambda: node.endpoint.failures >= 4)
+    failing = job(db, job_id)
+    assert failing["status"] == "signed"
+    assert failing["attempts"] == 0
+
+    node.endpoint.failing.clear()
+    wait_for(lambda: job(db, job_id)["status"] == "confirmed")
+    confirmed = job(db, job_id)
+    # The same signed transaction went out, no second nonce was used
+    assert (confirmed["nonce"], confirmed["tx_hash"]) == (failing["nonce"], failing["tx_hash"])
+    assert confirmed["attempts"] == 0
+    assert node.w3.eth.get_transaction_count(node.sender.address) == 1
+
+
+def test_restart_after_crash_rebroadcasts_the_signed_transaction(node, db, dispatchers, monkeypatch):
+    broadcast = chain.broadcast_raw_transaction
+
+    def crash(raw_tx):
+        raise Crash()
+
+    monkeypatch.setattr(threading, "excepthook", lambda args: None)
+    monkeypatch.setattr(chain, "broadcast_raw_transaction", crash)
+    first = dispatchers(db)
+    job_id = first.enqueue("nft", wallet(), student_id="S1", token_uri="ipfs://test")
+    wait_for(lambda: not first._threads[0].is_alive())
+    first.stop()
+    persisted = job(db, job_id)
+    assert persisted["status"] == "signed"
+    assert node.w3.eth.get_transaction_count(node.sender.address) == 0
+
+    # A fresh process: new nonce manager, the real broadcast, and signing watched
+    signed = []
+    sign = chain.sign_transaction
+    monkeypatch.setattr(chain, "broadcast_raw_transaction", broadcast)
+    monkeypatch.setattr(chain, "sign_transaction", lambda txn: signed.append(txn) or sign(txn))
+    monkeypatch.setattr(chain, "nonces", chain.NonceManager())
+    dispatchers(db)
+
+    wait_for(lambda: job(db, job_id)["status"] == "confirmed")
+    confirmed = job(db, job_id)
+    assert not signed
+    assert (confirmed["nonce"], confirmed["tx_hash"], confirmed["raw_tx"]) == \
+           (persisted["nonce"], persisted["tx_hash"], persisted["raw_tx"])
+    assert node.w3.eth.get_transaction_count(node.sender.address) == 1
+
+
+def test_stuck_transaction_is_replaced_with_higher_fees(node, db, dispatchers):
+    node.tester.disable_auto_mine_transactions()
+    dispatcher = dispatchers(db, stuck_after=0.3)
+    job_id = dispatcher.enqueue("token", wallet(), student_id="S1")
+
+    wait_for(lambda: job(db, job_id)["status"] == "submitted")
+    original = job(db, job_id)
+    original_tx = node.w3.eth.get_transaction(original["tx_hash"])
+
+    wait_for(lambda: job(db, job_id)["prior_tx_hashes"] and job(db, job_id)["status"] == "submitted")
+    replaced = job(db, job_id)
+    assert replaced["tx_hash"] != original["tx_hash"]
+    assert original["tx_hash"] in replaced["prior_tx_hashes"].split(",")
+    assert replaced["nonce"] == original["nonce"]
+    replacement_tx = node.w3.eth.get_transaction(replaced["tx_hash"])
+    assert replacement_tx["nonce"] == original_tx["nonce"]
+    assert replacement_tx["maxFeePerGas"] >= original_tx["maxFeePerGas"] * 1.1
+    assert replacement_tx["maxPriorityFeePerGas"] >= original_tx["maxPriorityFeePerGas"] * 1.1
+
+    node.tester.mine_blocks(1)
+    wait_for(lambda: job(db, job_id)["status"] == "confirmed")
+    assert job(db, job_id)["attempts"] == 0
+    assert node.w3.eth.get_transaction_count(node.sender.address) == 1
+
+
+def test_nft_jobs_are_deduplicated_per_student(db):
+    dispatcher = RewardDispatcher(db)
+    first = dispatcher.enqueue_many([
+        {"kind": "nft", "student_id": "S1", "wallet": "0x1"},
+        {"kind": "nft", "student_id": "S1", "wallet": "0x1"},
+        {"kind": "token", "student_id": "S1", "wallet": "0x1"},
+        {"kind": "nft", "student_id": "S2", "wallet": "0x2"},
+    ])
+    assert len(first) == 3
+    assert dispatcher.enqueue("nft", "0x1", student_id="S1") is None
+
+    # Only a failed mint lets the student be queued again
+    db.write(lambda conn: conn.execute("UPDATE reward_jobs SET status='confirmed' WHERE id=?", (first[0],)))
+    assert dispatcher.enqueue("nft", "0x1", student_id="S1") is None
+    db.write(lambda conn: conn.execute("UPDATE reward_jobs SET status='failed' WHERE id=?", (first[0],)))
+    assert dispatcher.enqueue("nft", "0x1", student_id="S1") is not None
@@ -0,0 +1,130 @@
+import pytest
+
+pytest.importorskip("web3")
+requests = pytest.importorskip("requests")
+
+from web3 import Web3
+from web3.providers.base import BaseProvider
+from rpc_provider import FailoverProvider
+
+
+class FlakyEndpoint(BaseProvider):
+    """Fails the first `failures` requests with `error`, then answers web3_clientVersion."""
+
+    def __init__(self, failures, error=requests.ConnectionError("connection refused")):
+        super().__init__()
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def make_request(self, method, params):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return {"jsonrpc": "2.0", "id": self.calls, "result": "flaky/1.0"}
+
+
+def provider(*endpoints, **kwargs):
+    kwargs.setdefault("backoff_base", 0.0)
+    return FailoverProvider(list(endpoints), names=[f"e{i}" for i in range(len(endpoints))], **kwargs)
+
+
+def test_retries_until_the_endpoint_recovers():
+    endpoint = FlakyEndpoint(failures=2)
+    failover = provider(endpoint)
+
+    response = failover.make_request("web3_clientVersion", [])
+
+    assert response["result"] == "flaky/1.0"
+    assert endpoint.calls == 3
+    stats = failover.stats()
+    assert stats["retries"] == 2
+    assert stats["endpoints"]["e0"]["errors"] == 2
+    assert not stats["endpoints"]["e0"]["down"]
+
+
+def test_gives_up_after_max_retries():
+    endpoint = FlakyEndpoint(failures=10)
+    failover = provider(endpoint, max_retries=2)
+
+    with pytest.raises(requests.ConnectionError):
+        failover.make_request("web3_clientVersion", [])
+    assert endpoint.calls == 3
+    assert not failover.is_connected()
+
+
+def test_non_transport_errors_are_not_retried():
+    endpoint = FlakyEndpoint(failures=1, error=ValueError("execution reverted"))
+    failover = provider(endpoint)
+
+    with pytest.raises(ValueError):
+        failover.make_request("eth_call", [])
+    assert endpoint.calls == 1
+    assert failover.stats()["retries"] == 0
+
+
+def test_fails_over_to_a_tester_node():
+    pytest.importorskip("eth_tester")
+    down = FlakyEndpoint(failures=10 ** 6)
+    failover = provider(down, Web3.EthereumTesterProvider(), cooldown=60.0)
+    w3 = Web3(failover)
+
+    assert w3.eth.block_number >= 0
+    assert w3.eth.get_balance(w3.eth.accounts[0]) > 0
+
+    stats = failover.stats()
+    assert stats["failovers"] == 1
+    assert stats["endpoints"]["e0"]["down"]
+    # The failed endpoint is skipped while it cools down
+    assert down.calls == 1
+
+
+@pytest.fixture
+def hung_endpoint():
+    """A local socket that accepts connections and counts requests but never answers."""
+    import socket
+    import threading
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(16)
+    accepted = []
+
+    def accept():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            accepted.append(conn)
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield f"http://127.0.0.1:{server.getsockname()[1]}", accepted
+    server.close()
+    for conn in accepted:
+        conn.close()
+
+
+def test_from_urls_times_out_once_per_attempt(hung_endpoint):
+    import time
+
+    url, accepted = hung_endpoint
+    failover = FailoverProvider.from_urls([url], timeout=0.3, max_retries=0)
+
+    started = time.monotonic()
+    with pytest.raises(requests.Timeout):
+        failover.make_request("eth_sendRawTransaction", ["0x00"])
+    # One POST and one timeout: HTTPProvider must not retry on its own
+    assert time.monotonic() - started < 1.5
+    assert len(accepted) == 1
+    assert failover.stats()["endpoints"][url]["requests"] == 1
+
+
+def test_from_urls_fails_over_from_a_hung_node(hung_endpoint):
+    pytest.importorskip("eth_tester")
+    url, _ = hung_endpoint
+    hung = FailoverProvider.from_urls([url], timeout=0.3).providers[0]
+    failover = provider(hung, Web3.EthereumTesterProvider())
+
+    assert Web3(failover).eth.block_number >= 0
+    assert failover.stats()["failovers"] == 1
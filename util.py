@@ -1,6 +1,10 @@
+import logging
 import sqlite3
+import datetime
 import face_recognition
-import numpy as np
+from face_gallery import DEFAULT_TOLERANCE
+from embedding_store import get_store
+from db import get_db
 import tkinter as tk
 import platform
 import subprocess
@@ -12,6 +16,8 @@ from tkinter import simpledialog
 from blockchain_utils import send_token_to_wallet as _send_token_to_wallet
 from blockchain_utils import mint_student_nft as _mint_student_nft
 
+log = logging.getLogger(__name__)
+
 # --------------------- UI ELEMENT HELPERS ---------------------
 
 def get_button(window, text, color, command, fg='white'):
@@ -84,48 +90,44 @@ def add_hover_effect(widget, normal_bg, hover_bg):
 
 # --------------------- FACE RECOGNITION ---------------------
 
-def recognize(img, db_path="face_data.db"):
+_recognize_galleries = {}
+
+def recognize(img, db_path="face_data.db", tolerance=DEFAULT_TOLERANCE):
     embeddings_unknown = face_recognition.face_encodings(img)
     if not embeddings_unknown:
         return 'no_persons_found'
 
     embeddings_unknown = embeddings_unknown[0]
 
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT student_id, embedding FROM users")
-    registered_users = cursor.fetchall()
-    conn.close()
+    # Shared memory-mapped store, only reloaded when the users table changed
+    store = get_store(db_path)
+    store.refresh_if_stale()
+    cached = _recognize_galleries.get(db_path)
+    if cached is None or cached[0] != store.version:
+        cached = _recognize_galleries[db_path] = (store.version, store.gallery())
+    gallery = cached[1]
 
-    for student_id, embedding_blob in registered_users:
-        stored_encoding = np.frombuffer(embedding_blob, dtype=np.float64)
-        match = face_recognition.compare_faces([stored_encoding], embeddings_unknown)[0]
-        if match:
-            return student_id
+    match = gallery.match(embeddings_unknown, tolerance=tolerance)
+    if match:
+        return match[0]
 
     return 'unknown_person'
 
 # --------------------- ATTENDANCE LOGS ---------------------
 
 def get_attendance_logs(db_path):
-    import sqlite3
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
     try:
-        cursor.execute("SELECT student_id, date, time FROM attendance")
-        logs = cursor.fetchall()
+        logs = get_db(db_path).query("SELECT student_id, date, time FROM attendance")
     except sqlite3.Error as e:
-        print(f"❌ Database error: {e}")
+        log.warning("❌ Database error: %s", e)
         logs = []
 
-    conn.close()
     return logs
 
 
 # --------------------- LECTURER PANEL UI ---------------------
 
-def build_lecturer_panel(parent, on_register_new_user, on_show_attendance, on_back):
+def build_lecturer_panel(parent, on_register_new_user, on_show_attendance, on_back, reward_dispatcher):
 
     parent.title("Lecturer Panel")
     parent.geometry("600x600")
@@ -170,7 +172,7 @@ def build_lecturer_panel(parent, on_register_new_user, on_show_attendance, on_ba
         padx=20,
         pady=10,
         width=25,
-        command=on_show_attendance
+        command=lambda: ask_attendance_filters(parent, on_show_attendance)
     ).pack(pady=10)
 
     # Reward Dashboard Button
@@ -205,7 +207,7 @@ def build_lecturer_panel(parent, on_register_new_user, on_show_attendance, on_ba
         bg="#00cec9",
         fg="black",
         width=25,
-        command=lambda: _mint_nft_gui(parent)
+        command=lambda: _mint_nft_gui(parent, reward_dispatcher)
     ).pack(pady=10)
     # Back Button
     back_button = tk.Button(
@@ -222,7 +224,52 @@ def build_lecturer_panel(parent, on_register_new_user, on_show_attendance, on_ba
     )
     back_button.place(x=10, y=20)  # position it exactly
 
+def ask_attendance_filters(parent, on_export):
+    """Date range, unit and student for the attendance export; calls on_export(start_date, end_date, unit, student_id)."""
+    today = datetime.date.today().isoformat()
+    dialog = tk.Toplevel(parent)
+    dialog.title("📋 Export Attendance")
+    dialog.config(bg="#eaf6f6")
+    dialog.transient(parent)
+
+    entries = {}
+    fields = (("start_date", "From (YYYY-MM-DD):", today), ("end_date", "To (YYYY-MM-DD):", today),
+              ("unit", "Unit (optional):", ""), ("student_id", "Student ID (optional):", ""))
+    for row, (key, label, default) in enumerate(fields):
+        tk.Label(dialog, text=label, bg="#eaf6f6", font=("Segoe UI", 12)).grid(
+            row=row, column=0, sticky="w", padx=10, pady=5)
+        entry = tk.Entry(dialog, font=("Segoe UI", 12), width=20)
+        entry.insert(0, default)
+        entry.grid(row=row, column=1, padx=10, pady=5)
+        entries[key] = entry
+
+    def export():
+        values = {key: entry.get().strip() or None for key, entry in entries.items()}
+        try:
+            start = datetime.date.fromisoformat(values["start_date"] or today)
+            end = datetime.date.fromisoformat(values["end_date"]) if values["end_date"] else start
+        except ValueError:
+            messagebox.showwarning("Input Error", "Dates must be in YYYY-MM-DD format.", parent=dialog)
+            return
+        if end < start:
+            messagebox.showwarning("Input Error", "The end date is before the start date.", parent=dialog)
+            return
+        dialog.destroy()
+        on_export(start.isoformat(), end.isoformat(), values["unit"], values["student_id"])
+
+    tk.Button(dialog, text="Export CSV", font=("Segoe UI", 12, "bold"), bg="#00b894", fg="white",
+              command=export).grid(row=len(fields), column=0, columnspan=2, pady=10)
+
 #-----------------Student panel ui-----------------------
+REWARD_SUMMARY_SQL = "SELECT student_id, attendance_days, nft_awarded, wallet FROM users"
+
+def fetch_reward_summary(student_id=None, db_path="face_data.db"):
+    # attendance_days is maintained by triggers on insert (see db.MIGRATIONS), so this is a plain read
+    db = get_db(db_path)
+    if student_id is not None:
+        return db.query_one(REWARD_SUMMARY_SQL + " WHERE student_id=?", (student_id,))
+    return db.query(REWARD_SUMMARY_SQL)
+
 def show_student_panel():
     window = tk.Toplevel()
     window.title("👤 Student Panel")
@@ -260,33 +307,7 @@ def show_student_panel():
             tk.messagebox.showwarning("Input Error", "Please enter a Student ID.")
             return
 
-        conn = sqlite3.connect("face_data.db")
-        cursor = conn.cursor()
-
-        # Ensure columns exist (optional, can skip if guaranteed)
-        cursor.execute("PRAGMA table_info(users)")
-        columns = [row[1] for row in cursor.fetchall()]
-        if "attendance_days" not in columns:
-            cursor.execute("ALTER TABLE users ADD COLUMN attendance_days INTEGER DEFAULT 0")
-        if "nft_awarded" not in columns:
-            cursor.execute("ALTER TABLE users ADD COLUMN nft_awarded INTEGER DEFAULT 0")
-        if "wallet" not in columns:
-            cursor.execute("ALTER TABLE users ADD COLUMN wallet TEXT")
-        conn.commit()
-
-        # Update attendance count before fetching (optional, same logic as your reward dashboard)
-        cursor.execute("SELECT student_id, COUNT(*) FROM attendance GROUP BY student_id")
-        attendance_counts = dict(cursor.fetchall())
-        for student, count in attendance_counts.items():
-            cursor.execute("UPDATE users SET attendance_days=? WHERE student_id=?", (count, student))
-        conn.commit()
-
-        cursor.execute(
-            "SELECT student_id, attendance_days, nft_awarded, wallet FROM users WHERE student_id=?",
-            (sid,)
-        )
-        data = cursor.fetchone()
-        conn.close()
+        data = fetch_reward_summary(sid)
 
         # Clear previous results
         for row in tree.get_children():
@@ -304,10 +325,158 @@ def show_student_panel():
     search_button.pack()
 
 
+# Dashboard column -> users column it sorts by (indexed with student_id as tie-breaker)
+REWARD_SORT_COLUMNS = {"ID": "student_id", "Tokens": "attendance_days", "NFT Earned": "nft_awarded"}
+
+def _reward_filters_sql(filters):
+    clauses, params = [], []
+    filters = filters or {}
+    if filters.get("student_id"):
+        prefix = filters["student_id"].replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        clauses.append("student_id LIKE ? ESCAPE '\\'")
+        params.append(prefix + "%")
+    if filters.get("min_tokens") is not None:
+        clauses.append("attendance_days >= ?")
+        params.append(filters["min_tokens"])
+    if filters.get("nft") is not None:
+        clauses.append("nft_awarded = ?")
+        params.append(1 if filters["nft"] else 0)
+    return clauses, params
+
+def count_reward_rows(filters=None, db_path="face_data.db"):
+    clauses, params = _reward_filters_sql(filters)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return get_db(db_path).query_one("SELECT COUNT(*) FROM users" + where, params)[0]
+
+def fetch_reward_page(limit, sort="student_id", descending=False, after=None, offset=0, filters=None,
+                      db_path="face_data.db"):
+    """One page of the reward summary, sorted and filtered in SQL.
+
+    Pass after=(sort_value, student_id) of the previous page's last row for a
+    keyset seek; offset is only used when jumping to a page with no known key.
+    """
+    if sort not in REWARD_SORT_COLUMNS.values():
+        raise ValueError(f"Unsupported sort column: {sort}")
+
+    clauses, params = _reward_filters_sql(filters)
+    direction = "DESC" if descending else "ASC"
+    op = "<" if descending else ">"
+
+    if after is not None:
+        if sort == "student_id":
+            clauses.append(f"student_id {op} ?")
+            params.append(after[1])
+        else:
+            clauses.append(f"({sort}, student_id) {op} (?, ?)")
+            params.extend(after)
+        offset = 0
+
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    order = "student_id" if sort == "student_id" else f"{sort} {direction}, student_id"
+    sql = f"{REWARD_SUMMARY_SQL}{where} ORDER BY {order} {direction} LIMIT ? OFFSET ?"
+    return get_db(db_path).query(sql, params + [limit, offset])
+
+
+class VirtualTreeview:
+    """ttk.Treeview that only holds the rows currently on screen.
+
+    Rows are pulled page by page through fetch_page(limit, after, offset) and
+    kept in a small page cache; scrolling reuses a fixed set of tree items.
+    """
+
+    def __init__(self, parent, columns, headings, fetch_page, count_rows, format_row, row_key,
+                 visible_rows=15, page_size=100, max_cached_pages=32, on_heading=None):
+        self.fetch_page = fetch_page
+        self.count_rows = count_rows
+        self.format_row = format_row
+        self.row_key = row_key
+        self.visible_rows = visible_rows
+        self.page_size = page_size
+        self.max_cached_pages = max_cached_pages
+        self.offset = 0
+        self.total = 0
+        self._pages = {}
+
+        self.tree = ttk.Treeview(parent, columns=columns, show="headings", height=visible_rows)
+        for column, text in zip(columns, headings):
+            command = (lambda c=column: on_heading(c)) if on_heading else None
+            self.tree.heading(column, text=text, command=command)
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self._on_scrollbar)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self._items = [self.tree.insert("", "end", values=()) for _ in range(visible_rows)]
+
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll_to(self.offset - (1 if e.delta > 0 else -1) * 3))
+        self.tree.bind("<Button-4>", lambda e: self.scroll_to(self.offset - 3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_to(self.offset + 3))
+        self.tree.bind("<Prior>", lambda e: self.scroll_to(self.offset - visible_rows))
+        self.tree.bind("<Next>", lambda e: self.scroll_to(self.offset + visible_rows))
+
+    def reset(self):
+        """Re-count and start from the top, e.g. after the sort or filters changed."""
+        self._pages.clear()
+        self.total = self.count_rows()
+        self.scroll_to(0)
+
+    def scroll_to(self, offset):
+        self.offset = max(0, min(offset, self.total - self.visible_rows))
+        rows = self._rows(self.offset, self.visible_rows)
+
+        for i, item in enumerate(self._items):
+            if i < len(rows):
+                self.tree.item(item, values=self.format_row(rows[i]))
+                self.tree.move(item, "", i)
+            else:
+                self.tree.detach(item)
+
+        if self.total:
+            self.scrollbar.set(self.offset / self.total, (self.offset + len(rows)) / self.total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.total))
+        elif unit == "pages":
+            self.scroll_to(self.offset + int(amount) * self.visible_rows)
+        else:
+            self.scroll_to(self.offset + int(amount))
+
+    def _rows(self, start, count):
+        rows = []
+        page = start // self.page_size
+        while len(rows) < count and page * self.page_size < self.total:
+            page_rows = self._page(page)
+            if not page_rows:
+                break
+            skip = start - page * self.page_size if not rows else 0
+            rows.extend(page_rows[skip:])
+            page += 1
+        return rows[:count]
+
+    def _page(self, page):
+        if page in self._pages:
+            return self._pages[page]
+
+        previous = self._pages.get(page - 1)
+        if previous and len(previous) == self.page_size:
+            # Sequential scrolling: seek from the last key instead of OFFSET
+            rows = self.fetch_page(self.page_size, self.row_key(previous[-1]), 0)
+        else:
+            rows = self.fetch_page(self.page_size, None, page * self.page_size)
+
+        if len(self._pages) >= self.max_cached_pages:
+            # Drop the page furthest from the one being shown
+            del self._pages[max(self._pages, key=lambda p: abs(p - page))]
+        self._pages[page] = rows
+        return rows
+
+
 def show_reward_dashboard():
     window = tk.Toplevel()
     window.title("🎁 Reward Dashboard")
-    window.geometry("700x400")
+    window.geometry("700x460")
     window.configure(bg="#f5f6fa")
 
     title = tk.Label(
@@ -319,52 +488,83 @@ def show_reward_dashboard():
     )
     title.pack(pady=10)
 
+    # Filter bar
+    filter_frame = tk.Frame(window, bg="#f5f6fa")
+    filter_frame.pack(fill="x", padx=10)
+
+    tk.Label(filter_frame, text="ID starts with:", bg="#f5f6fa", font=("Segoe UI", 10)).pack(side="left")
+    id_entry = tk.Entry(filter_frame, font=("Segoe UI", 10), width=12)
+    id_entry.pack(side="left", padx=(0, 10))
+
+    tk.Label(filter_frame, text="Min tokens:", bg="#f5f6fa", font=("Segoe UI", 10)).pack(side="left")
+    tokens_entry = tk.Entry(filter_frame, font=("Segoe UI", 10), width=6)
+    tokens_entry.pack(side="left", padx=(0, 10))
+
+    tk.Label(filter_frame, text="NFT:", bg="#f5f6fa", font=("Segoe UI", 10)).pack(side="left")
+    nft_choice = ttk.Combobox(filter_frame, values=("All", "Yes", "No"), width=5, state="readonly")
+    nft_choice.current(0)
+    nft_choice.pack(side="left", padx=(0, 10))
+
+    total_label = tk.Label(filter_frame, text="", bg="#f5f6fa", font=("Segoe UI", 10))
+    total_label.pack(side="right")
+
     # Table frame
     table_frame = tk.Frame(window)
     table_frame.pack(fill="both", expand=True)
 
-    # Table with Scrollbar
-    tree = ttk.Treeview(table_frame, columns=("ID", "Tokens", "NFT Earned", "Wallet"), show="headings")
-    tree.heading("ID", text="Student ID")
-    tree.heading("Tokens", text="Tokens")
-    tree.heading("NFT Earned", text="NFT Awarded")
-    tree.heading("Wallet", text="Wallet Address")
+    state = {"sort": "student_id", "descending": False, "filters": {}}
 
-    scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=tree.yview)
-    tree.configure(yscrollcommand=scrollbar.set)
-    tree.pack(side="left", fill="both", expand=True)
-    scrollbar.pack(side="right", fill="y")
+    def fetch_page(limit, after, offset):
+        return fetch_reward_page(limit, state["sort"], state["descending"], after, offset, state["filters"])
 
-    # Fetch data from DB
-    conn = sqlite3.connect("face_data.db")
-    cursor = conn.cursor()
+    def row_key(row):
+        student_id, tokens, nft, _ = row
+        value = {"student_id": student_id, "attendance_days": tokens, "nft_awarded": nft}[state["sort"]]
+        return value, student_id
 
-    # Make sure necessary columns exist
-    cursor.execute("PRAGMA table_info(users)")
-    columns = [row[1] for row in cursor.fetchall()]
-    if "attendance_days" not in columns:
-        cursor.execute("ALTER TABLE users ADD COLUMN attendance_days INTEGER DEFAULT 0")
-    if "nft_awarded" not in columns:
-        cursor.execute("ALTER TABLE users ADD COLUMN nft_awarded INTEGER DEFAULT 0")
-    if "wallet" not in columns:
-        cursor.execute("ALTER TABLE users ADD COLUMN wallet TEXT")
+    def on_heading(column):
+        sort = REWARD_SORT_COLUMNS.get(column)
+        if not sort:
+            return
+        state["descending"] = not state["descending"] if state["sort"] == sort else False
+        state["sort"] = sort
+        refresh()
+
+    # Table with Scrollbar, only the visible rows are ever inserted
+    table = VirtualTreeview(
+        table_frame,
+        columns=("ID", "Tokens", "NFT Earned", "Wallet"),
+        headings=("Student ID", "Tokens", "NFT Awarded", "Wallet Address"),
+        fetch_page=fetch_page,
+        count_rows=lambda: count_reward_rows(state["filters"]),
+        format_row=lambda r: (r[0], r[1], "Yes" if r[2] else "No", r[3] or "N/A"),
+        row_key=row_key,
+        on_heading=on_heading
+    )
 
-    conn.commit()
+    def refresh():
+        table.reset()
+        total_label.config(text=f"{table.total} students")
 
-    # Update attendance_days based on attendance table
-    cursor.execute("SELECT student_id, COUNT(*) FROM attendance GROUP BY student_id")
-    attendance_counts = dict(cursor.fetchall())
-    for sid, count in attendance_counts.items():
-        cursor.execute("UPDATE users SET attendance_days=? WHERE student_id=?", (count, sid))
-    conn.commit()
+    def apply_filters():
+        filters = {}
+        if id_entry.get().strip():
+            filters["student_id"] = id_entry.get().strip()
+        if tokens_entry.get().strip():
+            try:
+                filters["min_tokens"] = int(tokens_entry.get().strip())
+            except ValueError:
+                messagebox.showwarning("Input Error", "Min tokens must be a number.")
+                return
+        if nft_choice.get() != "All":
+            filters["nft"] = nft_choice.get() == "Yes"
+        state["filters"] = filters
+        refresh()
 
-    cursor.execute("SELECT student_id, attendance_days, nft_awarded, wallet FROM users")
-    data = cursor.fetchall()
-    conn.close()
+    tk.Button(filter_frame, text="Apply", font=("Segoe UI", 10, "bold"), bg="#009999", fg="white",
+              command=apply_filters).pack(side="left")
 
-    # Insert into table
-    for student_id, tokens, nft, wallet in data:
-        tree.insert("", "end", values=(student_id, tokens, "Yes" if nft else "No", wallet or "N/A"))
+    refresh()
 
 
 # --------------------- EMOJI ANIMATION ---------------------
@@ -416,7 +616,7 @@ def play_success_sound(self):
             else:  # Linux
                 subprocess.call(['aplay', '/usr/share/sounds/alsa/Front_Center.wav'])
         except:
-            print("🔇 Could not play sound")
+            log.warning("🔇 Could not play sound")
 
 # --------------------- WEB3 WRAPPERS ---------------------
 
@@ -436,11 +636,7 @@ def _send_token_gui(parent):
     if not sid:
         return
 
-    conn = sqlite3.connect("face_data.db")
-    cur = conn.cursor()
-    cur.execute("SELECT wallet FROM users WHERE student_id=?", (sid,))
-    row = cur.fetchone()
-    conn.close()
+    row = get_db().query_one("SELECT wallet FROM users WHERE student_id=?", (sid,))
 
     if not row or not row[0]:
         messagebox.showerror("Error", "No wallet found for that student.")
@@ -453,42 +649,38 @@ def _send_token_gui(parent):
     else:
         messagebox.showerror("Error", "Token transfer failed.")
 
-def _mint_nft_gui(parent):
+def _mint_nft_gui(parent, reward_dispatcher):
     sid = prompt_for_student_id(parent)
     if not sid:
         return
 
-    conn = sqlite3.connect("face_data.db")
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM attendance WHERE student_id=?", (sid,))
-    count = cur.fetchone()[0]
-    cur.execute("SELECT nft_awarded, wallet FROM users WHERE student_id=?", (sid,))
-    row = cur.fetchone()
-    conn.close()
+    db = get_db()
+    row = db.query_one("SELECT nft_awarded, wallet, attendance_days FROM users WHERE student_id=?", (sid,))
 
     if not row:
         messagebox.showerror("Error", "Student not found.")
         return
 
-    nft_awarded, wallet = row
+    nft_awarded, wallet, count = row
+    count = count or 0
     if nft_awarded:
         messagebox.showinfo("Already Awarded", "This student already has an NFT.")
         return
     if count < 100:
         messagebox.showinfo("Not Eligible", f"Only {count} attendances — need 100.")
         return
+    if not wallet:
+        messagebox.showerror("Error", "No wallet found for that student.")
+        return
 
     token_uri = simpledialog.askstring("Metadata URI", "Enter IPFS tokenURI:", parent=parent)
     if not token_uri:
         return
 
-    receipt = mint_nft_if_eligible(wallet, token_uri)
-    if receipt:
-        conn = sqlite3.connect("face_data.db")
-        cur = conn.cursor()
-        cur.execute("UPDATE users SET nft_awarded=1 WHERE student_id=?", (sid,))
-        conn.commit()
-        conn.close()
-        messagebox.showinfo("NFT Minted", f"Tx hash:\n{receipt.transactionHash.hex()}")
+    # Through the reward queue so a mint the kiosk already queued or sent for this student isn't
+    # repeated; the dispatcher sets nft_awarded once it is confirmed
+    job_id = reward_dispatcher.enqueue("nft", wallet, student_id=sid, token_uri=token_uri)
+    if job_id is None:
+        messagebox.showinfo("Already Queued", "An NFT for this student is already queued or minted.")
     else:
-        messagebox.showerror("Error", "NFT minting failed.")
+        messagebox.showinfo("NFT Queued", "The NFT will be minted in the background.")